@@ -3,39 +3,72 @@ import tempfile
 import os
 
 import numpy as np
-from sklearn.metrics import confusion_matrix
 
-from rastervision.utils.files import json_to_file
 from noisy_buildings_semseg.data import (
     VegasBuildings, NoiseMode, get_root_uri, stats_uri)
-from noisy_buildings_semseg.exp import (
+from noisy_buildings_semseg.builders import (
     build_task, build_scene)
+from noisy_buildings_semseg.metrics import (
+    get_conf_mat, get_tolerant_counts, get_instance_counts)
+from noisy_buildings_semseg.sampling import sample_until_precise, error_types
 
 
-def compute_noise_metrics(scene_ids, spacenet_config, noise_mode, building_class_id):
-    print('Computing metrics for {}...'.format(str(noise_mode)))
-    tmp_dir_obj = tempfile.TemporaryDirectory()
-    tmp_dir = tmp_dir_obj.name
-    conf_mat = np.zeros((3, 3))
+def compute_noise_metrics(scene_ids, spacenet_config, noise_mode, building_class_id,
+                          tmp_dir, rng, precision=0.01):
+    """Compare the original and noisy labels for a noise mode.
+
+    Scenes are sampled from scene_ids until the confidence intervals of the
+    label error rates are within precision. See sample_until_precise.
 
-    for scene_id in scene_ids:
-        task_config = build_task(spacenet_config.get_class_map())
+    Returns:
+        dict with the conf_mat, and the tolerant_counts and instance_counts
+        from metrics.py, of the noisy labels against the original labels
+        summed over sampled scenes, the intervals of the error rates, whether
+        they are within precision, and the conf_mat of each sampled scene
+    """
+    print('Computing metrics for {}...'.format(str(noise_mode)))
+    task_config = build_task(spacenet_config.get_class_map())
 
+    def compute_scene_metrics(scene_id):
+        # The source data is read through the local cache, so it is only
+        # downloaded once across all noise modes.
         orig_scene = build_scene(
-            task_config, spacenet_config, noise_mode, scene_id, True)
+            task_config, spacenet_config, noise_mode, scene_id, True,
+            use_cache=True)
         orig_scene = orig_scene.create_scene(task_config, tmp_dir)
         noisy_scene = build_scene(
-            task_config, spacenet_config, noise_mode, scene_id, False)
+            task_config, spacenet_config, noise_mode, scene_id, False,
+            use_cache=True)
         noisy_scene = noisy_scene.create_scene(task_config, tmp_dir)
         with orig_scene.ground_truth_label_source.source.activate():
             orig_arr = orig_scene.ground_truth_label_source.source.get_image_array()
         with noisy_scene.ground_truth_label_source.source.activate():
             noisy_arr = noisy_scene.ground_truth_label_source.source.get_image_array()
-        conf_mat += confusion_matrix(orig_arr.ravel(), noisy_arr.ravel(), labels=[0, 1, 2])
+        return {
+            'conf_mat': get_conf_mat(orig_arr, noisy_arr),
+            'tolerant_counts': get_tolerant_counts(orig_arr, noisy_arr),
+            'instance_counts': get_instance_counts(orig_arr, noisy_arr)
+        }
 
-    return conf_mat.tolist()
+    sampled_ids, scene_metrics, intervals, is_precise = sample_until_precise(
+        scene_ids, compute_scene_metrics, rng, precision=precision)
+
+    stats = {}
+    for key in ['conf_mat', 'tolerant_counts', 'instance_counts']:
+        stats[key] = np.sum(
+            [m[key] for m in scene_metrics], axis=0).astype(float).tolist()
+    stats['intervals'] = {
+        error_type: interval.tolist()
+        for error_type, interval in zip(error_types, intervals)}
+    stats['is_precise'] = is_precise
+    stats['scenes'] = {
+        scene_id: m['conf_mat'].tolist()
+        for scene_id, m in zip(sampled_ids, scene_metrics)}
+    return stats
 
 def main():
+    from rastervision.utils.files import json_to_file
+
     random.seed(5678)
     use_remote_data = False
     vb = VegasBuildings(use_remote_data)
@@ -44,19 +77,26 @@ def main():
     shifts = [0, 10, 20, 30, 40, 50]
     probs = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
 
-    sample_sz = 50
+    # Scenes are sampled in this order until the label error rates are
+    # estimated to within precision.
+    precision = 0.01
     random.shuffle(scene_ids)
-    scene_ids = scene_ids[0:sample_sz]
+    rng = np.random.RandomState(5678)
     building_class_id = vb.get_class_map()['Building'][0]
 
     stats = {}
-    for shift in shifts:
-        nm = NoiseMode(NoiseMode.SHIFT, shift)
-        stats[str(nm)] = compute_noise_metrics(scene_ids, vb, nm, building_class_id)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for shift in shifts:
+            nm = NoiseMode(NoiseMode.SHIFT, shift)
+            stats[str(nm)] = compute_noise_metrics(
+                scene_ids, vb, nm, building_class_id, tmp_dir, rng,
+                precision=precision)
 
-    for prob in probs:
-        nm = NoiseMode(NoiseMode.DROP, prob)
-        stats[str(nm)] = compute_noise_metrics(scene_ids, vb, nm, building_class_id)
+        for prob in probs:
+            nm = NoiseMode(NoiseMode.DROP, prob)
+            stats[str(nm)] = compute_noise_metrics(
+                scene_ids, vb, nm, building_class_id, tmp_dir, rng,
+                precision=precision)
 
     json_to_file(stats, stats_uri)
 
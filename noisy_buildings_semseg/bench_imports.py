@@ -0,0 +1,76 @@
+import sys
+import json
+import subprocess
+
+# Modules that are slow to import, and should only be imported on first use.
+heavy_modules = [
+    'rastervision', 'rasterio', 'shapely', 'sklearn', 'scipy', 'matplotlib',
+    'boto3']
+
+# Maximum import time in seconds for each module of this package. exp is not
+# included since RV needs NoisyBuildingsSemseg to subclass rv.ExperimentSet.
+import_budgets = {
+    'noisy_buildings_semseg.data': 0.05,
+    'noisy_buildings_semseg.cache': 0.05,
+    'noisy_buildings_semseg.builders': 0.05,
+    'noisy_buildings_semseg.geo': 0.05,
+    'noisy_buildings_semseg.noise': 0.3,
+    'noisy_buildings_semseg.metrics': 0.3,
+    'noisy_buildings_semseg.prep': 0.3,
+    'noisy_buildings_semseg.analyze': 0.3,
+    'noisy_buildings_semseg.evaluate': 0.3,
+    'noisy_buildings_semseg.chip_index': 0.3,
+    'noisy_buildings_semseg.results': 0.3,
+    'noisy_buildings_semseg.plot_images': 0.3,
+    'noisy_buildings_semseg.plot_combined_curves': 0.3,
+    'noisy_buildings_semseg.plot_separate_curves': 0.3,
+}
+
+bench_code = '''
+import sys
+import json
+import time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy_modules = {heavy_modules!r}
+print(json.dumps({{
+    'time': elapsed,
+    'heavy_modules': [m for m in heavy_modules if m in sys.modules]
+}}))
+'''
+
+
+def bench_import(module, num_trials=5):
+    """Import module in fresh interpreters and return the fastest result.
+
+    Returns:
+        (import time in seconds, list of heavy modules that were imported)
+    """
+    results = []
+    for _ in range(num_trials):
+        code = bench_code.format(module=module, heavy_modules=heavy_modules)
+        out = subprocess.check_output([sys.executable, '-c', code])
+        results.append(json.loads(out.decode().splitlines()[-1]))
+    best = min(results, key=lambda r: r['time'])
+    return best['time'], best['heavy_modules']
+
+
+def main():
+    failed = False
+    for module, budget in import_budgets.items():
+        import_time, imported_heavy_modules = bench_import(module)
+        ok = import_time <= budget and len(imported_heavy_modules) == 0
+        failed = failed or not ok
+        msg = '{:<4} {}: {:.1f}ms (budget {:.1f}ms)'.format(
+            'ok' if ok else 'FAIL', module, import_time * 1000, budget * 1000)
+        if imported_heavy_modules:
+            msg += ' imports {}'.format(', '.join(imported_heavy_modules))
+        print(msg)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Builders for the RV configs of the experiments.
+
+These are separate from exp.py so that they can be used without importing
+rastervision until a config is built.
+"""
+import random
+
+from noisy_buildings_semseg.cache import get_cached_path
+
+chip_size = 300
+chip_stride = 300
+
+
+def build_scene(task, spacenet_config, noise_mode, id, is_validation,
+                use_cache=False, filter_chips=False):
+    """Build a scene config.
+
+    If use_cache is True, the scene refers to copies of the remote data in the
+    local cache. This should only be used for scenes that are processed on
+    this machine, and not for ones in experiments run remotely.
+
+    If filter_chips is True, the scene uses the AOI written by chip_index.py,
+    so only the chips selected for training are used.
+    """
+    import rastervision as rv
+
+    raster_uri = spacenet_config.get_raster_source_uri(id)
+    vector_source = (spacenet_config.get_geojson_uri(id) if is_validation else
+                     spacenet_config.get_noisy_geojson_uri(noise_mode, id))
+    if use_cache:
+        raster_uri = get_cached_path(raster_uri)
+        vector_source = get_cached_path(vector_source)
+
+    raster_source = rv.RasterSourceConfig.builder(rv.RASTERIO_SOURCE) \
+                      .with_uri(raster_uri) \
+                      .with_channel_order([0, 1, 2]) \
+                      .with_stats_transformer() \
+                      .build()
+
+    background_class_id = 2
+    label_raster_source = rv.RasterSourceConfig.builder(rv.RASTERIZED_SOURCE) \
+        .with_vector_source(vector_source) \
+        .with_rasterizer_options(background_class_id) \
+        .build()
+    label_source = rv.LabelSourceConfig.builder(rv.SEMANTIC_SEGMENTATION) \
+        .with_raster_source(label_raster_source) \
+        .build()
+
+    scene = rv.SceneConfig.builder() \
+                          .with_task(task) \
+                          .with_id(id) \
+                          .with_raster_source(raster_source) \
+                          .with_label_source(label_source)
+    if filter_chips:
+        scene = scene.with_aoi_uri(
+            spacenet_config.get_chip_aoi_uri(noise_mode, id))
+    scene = scene.build()
+
+    return scene
+
+
+def get_scene_split(spacenet_config, test):
+    """Return the training and validation scene ids."""
+    scene_ids = spacenet_config.get_scene_ids()
+    if len(scene_ids) == 0:
+        raise ValueError('No scenes found. Something is configured incorrectly.')
+    scene_ids.sort()
+    random.seed(5678)
+    random.shuffle(scene_ids)
+    train_prop = 0.8
+
+    num_ids = len(scene_ids)
+    # Use subset of scenes.
+    num_ids = 1000
+    if test:
+        num_ids = 20
+    num_train_ids = round(num_ids * train_prop)
+    num_val_ids = num_ids - num_train_ids
+    train_ids = scene_ids[0:num_train_ids]
+    val_ids = scene_ids[num_train_ids:num_train_ids+num_val_ids]
+    return train_ids, val_ids
+
+
+def build_dataset(task, spacenet_config, test, noise_mode, filter_chips=False):
+    import rastervision as rv
+
+    train_ids, val_ids = get_scene_split(spacenet_config, test)
+
+    is_validation = False
+    train_scenes = [build_scene(task, spacenet_config, noise_mode, id, is_validation,
+                                filter_chips=filter_chips)
+                    for id in train_ids]
+    is_validation = True
+    val_scenes = [build_scene(task, spacenet_config, noise_mode, id, is_validation)
+                  for id in val_ids]
+    dataset = rv.DatasetConfig.builder() \
+                              .with_train_scenes(train_scenes) \
+                              .with_validation_scenes(val_scenes) \
+                              .build()
+
+    return dataset
+
+
+def build_task(class_map):
+    import rastervision as rv
+
+    task = rv.TaskConfig.builder(rv.SEMANTIC_SEGMENTATION) \
+                        .with_chip_size(chip_size) \
+                        .with_classes(class_map) \
+                        .with_chip_options(
+                            window_method='sliding',
+                            stride=chip_stride) \
+                        .build()
+    return task
+
+
+def build_deeplab_backend(task, test):
+    import rastervision as rv
+
+    debug = False
+    batch_size = 8
+    num_steps = 30000
+    if test:
+        debug = True
+        num_steps = 1
+        batch_size = 1
+
+    backend = rv.BackendConfig.builder(rv.TF_DEEPLAB) \
+                              .with_task(task) \
+                              .with_model_defaults(rv.MOBILENET_V2) \
+                              .with_num_steps(num_steps) \
+                              .with_batch_size(batch_size) \
+                              .with_debug(debug) \
+                              .build()
+
+    return backend
+
+
+def build_fastai_backend(task, test):
+    import rastervision as rv
+
+    debug = False
+    batch_sz = 8
+    num_epochs = 10
+    if test:
+        debug = True
+        batch_sz = 1
+        num_epochs = 1
+
+    config = {
+        'batch_sz': batch_sz,
+        'num_epochs': num_epochs,
+        'debug': debug,
+        'lr': 1e-4,
+        'sync_interval': 10,
+        'model_arch': 'resnet18'
+    }
+
+    backend = rv.BackendConfig.builder('FASTAI_SEMANTIC_SEGMENTATION') \
+                              .with_task(task) \
+                              .with_train_options(**config) \
+                              .build()
+    return backend
+
+
+def str_to_bool(x):
+    if type(x) == str:
+        if x.lower() == 'true':
+            return True
+        elif x.lower() == 'false':
+            return False
+        else:
+            raise ValueError('{} is expected to be true or false'.format(x))
+    return x
@@ -0,0 +1,190 @@
+import os
+import time
+import hashlib
+import fcntl
+import tempfile
+import contextlib
+from urllib.parse import urlparse
+
+# You may need to adjust these settings. The cache is shared by all processes
+# on a machine, so remote objects are only downloaded once.
+cache_dir = os.environ.get(
+    'NOISY_BUILDINGS_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'noisy-buildings-semseg'))
+max_cache_size = int(os.environ.get(
+    'NOISY_BUILDINGS_CACHE_SIZE', 50 * 1024 ** 3))
+# Files used within this many seconds are never evicted, since callers open
+# the path returned by get_cached_path after its lock is released.
+min_evict_age = int(os.environ.get('NOISY_BUILDINGS_CACHE_MIN_AGE', 60 * 60))
+
+REMOTE_SCHEMES = ['s3', 'http', 'https']
+
+
+def is_remote(uri):
+    return urlparse(uri).scheme in REMOTE_SCHEMES
+
+
+@contextlib.contextmanager
+def file_lock(lock_path, shared=False):
+    """Hold an flock on lock_path, so the cache is safe across processes."""
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_etag(uri):
+    """Return the ETag of a remote object.
+
+    HTTP servers which don't send an ETag are asked for Last-Modified
+    instead. Missing objects raise a botocore ClientError for S3 and a
+    urllib HTTPError for HTTP.
+
+    Returns:
+        the ETag, or None if the server sends neither header
+    """
+    parsed_uri = urlparse(uri)
+    if parsed_uri.scheme == 's3':
+        import boto3
+
+        s3 = boto3.client('s3')
+        head = s3.head_object(
+            Bucket=parsed_uri.netloc, Key=parsed_uri.path.lstrip('/'))
+        return head['ETag'].strip('"')
+
+    from urllib.request import Request, urlopen
+
+    with urlopen(Request(uri, method='HEAD')) as response:
+        etag = response.headers.get('ETag')
+        if etag is None:
+            return response.headers.get('Last-Modified')
+        return etag.strip('"')
+
+
+def get_cache_path(uri, etag):
+    key = hashlib.sha256('{}\n{}'.format(uri, etag).encode()).hexdigest()
+    # Keep the extension so that rasterio and RV can infer the file format.
+    ext = os.path.splitext(urlparse(uri).path)[1]
+    return os.path.join(cache_dir, key[0:2], key + ext)
+
+
+def get_size_path():
+    """Return the path of the file with the total size of the cache.
+
+    This is kept up to date on each download, so the cache is only walked
+    when it might be over max_cache_size.
+    """
+    return os.path.join(cache_dir, '.size')
+
+
+def get_cache_size():
+    cache_size = 0
+    entries = []
+    for dirpath, dirnames, fns in os.walk(cache_dir):
+        # Skip the temporary directories of in-progress downloads.
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for fn in fns:
+            if fn.endswith('.lock') or fn.startswith('.'):
+                continue
+            path = os.path.join(dirpath, fn)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cache_size += st.st_size
+            entries.append((st.st_mtime, st.st_size, path))
+    return cache_size, entries
+
+
+def evict(keep_path=None):
+    """Delete least recently used files until the cache fits in max_cache_size.
+
+    Files used in the last min_evict_age seconds are kept, so a path is not
+    deleted between get_cached_path returning it and the caller opening it.
+    Lock files are never deleted, so that every process agrees on which lock
+    guards a path.
+
+    Returns:
+        (size of the cache after eviction, time after which another eviction
+         could free space if the cache is still too large)
+    """
+    cache_size, entries = get_cache_size()
+    entries.sort()
+    for _, size, path in entries:
+        if cache_size <= max_cache_size:
+            break
+        if path == keep_path:
+            continue
+        with file_lock(path + '.lock'):
+            # The file may have been used since the cache was walked.
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                cache_size -= size
+                continue
+            if mtime >= time.time() - min_evict_age:
+                # Entries are sorted by mtime, so all the others are recent.
+                return cache_size, mtime + min_evict_age
+            os.remove(path)
+        cache_size -= size
+    return cache_size, 0.0
+
+
+def add_to_cache_size(path):
+    """Add the size of a downloaded file to the cache size, evicting if needed.
+
+    The size file holds the size of the cache, and the time before which
+    evicting is pointless because every file is recently used, so the cache
+    is only walked when eviction can free space.
+    """
+    size_path = get_size_path()
+    with file_lock(os.path.join(cache_dir, 'evict.lock')):
+        try:
+            with open(size_path) as size_file:
+                cache_size, evict_time = size_file.read().split()
+            cache_size = int(cache_size) + os.path.getsize(path)
+            evict_time = float(evict_time)
+        except (FileNotFoundError, ValueError):
+            cache_size, evict_time = None, 0.0
+
+        if cache_size is None or (
+                cache_size > max_cache_size and time.time() >= evict_time):
+            cache_size, evict_time = evict(keep_path=path)
+        with open(size_path, 'w') as size_file:
+            size_file.write('{} {}'.format(cache_size, evict_time))
+
+
+def get_cached_path(uri):
+    """Return a local path for uri, downloading it into the cache if needed.
+
+    Local URIs are returned unchanged. Remote objects are keyed by URI and
+    ETag, so a modified object is downloaded again, and each version is
+    downloaded at most once per machine.
+    """
+    if not is_remote(uri):
+        return uri
+    from rastervision.utils.files import download_if_needed
+
+    path = get_cache_path(uri, get_etag(uri))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path + '.lock'):
+        if os.path.isfile(path):
+            # Touch the file so it's treated as recently used.
+            os.utime(path)
+            return path
+
+        print('Caching {}...'.format(uri))
+        with tempfile.TemporaryDirectory(
+                dir=os.path.dirname(path), prefix='.') as tmp_dir:
+            download_path = download_if_needed(uri, tmp_dir)
+            os.replace(download_path, path)
+
+    add_to_cache_size(path)
+    return path
+
+
+def cached_file_to_str(uri):
+    with open(get_cached_path(uri)) as f:
+        return f.read()
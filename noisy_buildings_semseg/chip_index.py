@@ -0,0 +1,218 @@
+import json
+
+import numpy as np
+
+from noisy_buildings_semseg.data import (
+    VegasBuildings, NoiseMode, get_chip_index_uri)
+from noisy_buildings_semseg.cache import get_cached_path
+from noisy_buildings_semseg.builders import (
+    get_scene_split, chip_size, chip_stride)
+from noisy_buildings_semseg.geo import get_label_shapes
+from noisy_buildings_semseg.metrics import building_class_id
+
+# Bins of building pixel fraction used to balance chips by building density.
+density_bins = [0.0, 0.05, 0.1, 0.2, 0.4, 1.0]
+
+
+def get_window_offsets(height, width):
+    """Return the (row, col) offsets of the sliding windows of a scene.
+
+    These are in the same order as the windows RV uses for the sliding window
+    method.
+    """
+    rows, cols = np.meshgrid(
+        np.arange(0, height, chip_stride), np.arange(0, width, chip_stride),
+        indexing='ij')
+    return np.stack([rows.ravel(), cols.ravel()], axis=1)
+
+
+def get_window_fractions(label_arr):
+    """Return the building pixel fraction of each sliding window.
+
+    Windows can extend past the scene, where there are no buildings.
+    """
+    height, width = label_arr.shape
+    # Summed area table, so each window sum takes constant time.
+    sums = np.zeros((height + 1, width + 1))
+    sums[1:, 1:] = np.cumsum(np.cumsum(label_arr == building_class_id, 0), 1)
+
+    offsets = get_window_offsets(height, width)
+    row0, col0 = offsets[:, 0], offsets[:, 1]
+    row1 = np.minimum(row0 + chip_size, height)
+    col1 = np.minimum(col0 + chip_size, width)
+    window_sums = (sums[row1, col1] - sums[row0, col1] - sums[row1, col0] +
+                   sums[row0, col0])
+    return window_sums / chip_size ** 2
+
+
+def build_chip_index(vb, scene_ids, noise_mode):
+    """Compute the building pixel fraction of each window of the noisy labels.
+
+    Returns:
+        dict from scene id to dict with the height, width, affine transform
+        and CRS of the scene, and the fractions of its windows
+    """
+    import rasterio
+    from rasterio.features import rasterize
+
+    print('Indexing chips for {}...'.format(noise_mode))
+    index = {}
+    for scene_id in scene_ids:
+        raster_uri = get_cached_path(vb.get_raster_source_uri(scene_id))
+        with rasterio.open(raster_uri) as dataset:
+            height, width = dataset.height, dataset.width
+            transform, crs = dataset.transform, dataset.crs
+
+        shapes = get_label_shapes(
+            vb.get_noisy_geojson_uri(noise_mode, scene_id), crs,
+            building_class_id)
+        label_arr = np.zeros((height, width), dtype=np.uint8)
+        if len(shapes) > 0:
+            label_arr = rasterize(
+                shapes, out_shape=(height, width), transform=transform,
+                dtype=np.uint8)
+
+        index[scene_id] = {
+            'height': height,
+            'width': width,
+            'transform': list(transform)[0:6],
+            'crs': crs.to_string(),
+            'fractions': get_window_fractions(label_arr).tolist()
+        }
+    return index
+
+
+def select_chips(index, rng, empty_survival_prob=0.1, balance_ratio=2.0):
+    """Select the windows to train on.
+
+    Windows without buildings are kept with probability empty_survival_prob.
+    Windows with buildings are binned by building fraction using
+    density_bins, and windows in a bin are subsampled so that no bin has more
+    than balance_ratio times as many windows as the median non-empty bin.
+    This mostly thins out windows with few building pixels.
+
+    Args:
+        index: output of build_chip_index
+        rng: np.random.RandomState
+        balance_ratio: if None, don't balance by density
+
+    Returns:
+        dict from scene id to boolean array of which windows to keep
+    """
+    scene_ids = list(index.keys())
+    fractions = [np.array(index[scene_id]['fractions']) for scene_id in scene_ids]
+    all_fractions = np.concatenate(fractions)
+
+    bins = np.digitize(all_fractions, density_bins[1:-1])
+    bins[all_fractions == 0] = -1
+    keep_probs = np.where(bins == -1, empty_survival_prob, 1.0)
+    if balance_ratio is not None:
+        bin_counts = np.bincount(bins[bins >= 0], minlength=len(density_bins) - 1)
+        if np.any(bin_counts > 0):
+            max_count = balance_ratio * np.median(bin_counts[bin_counts > 0])
+            bin_probs = np.minimum(1.0, max_count / np.maximum(bin_counts, 1))
+            keep_probs[bins >= 0] = bin_probs[bins[bins >= 0]]
+    keep = rng.uniform(0.0, 1.0, size=len(all_fractions)) < keep_probs
+
+    total_fraction = all_fractions.mean() if len(all_fractions) > 0 else 0.0
+    kept_fraction = all_fractions[keep].mean() if keep.any() else 0.0
+    print('Keeping {} of {} chips, building pixel fraction {:.3f} -> {:.3f}'.format(
+        keep.sum(), len(keep), total_fraction, kept_fraction))
+
+    splits = np.cumsum([len(f) for f in fractions])[:-1]
+    return dict(zip(scene_ids, np.split(keep, splits)))
+
+
+def get_chip_aoi(scene_index, keep):
+    """Return a GeoJSON AOI which contains the windows to keep.
+
+    RV only uses windows that are within the AOI of a scene, so each kept
+    window becomes a polygon padded by a pixel, which allows for RV rounding
+    the AOI to pixel coordinates.
+    """
+    from affine import Affine
+    from rasterio.crs import CRS
+    from rasterio.warp import transform
+
+    offsets = get_window_offsets(scene_index['height'], scene_index['width'])
+    offsets = offsets[keep]
+    if len(offsets) == 0:
+        # An empty AOI means the whole scene, so use a window outside the
+        # scene instead.
+        offsets = np.array([[-2 * chip_size, -2 * chip_size]])
+
+    row0 = offsets[:, 0] - 1
+    col0 = offsets[:, 1] - 1
+    row1 = row0 + chip_size + 2
+    col1 = col0 + chip_size + 2
+    # (num_windows, 5, 2) array of closed rings of (col, row) coordinates
+    rings = np.stack([
+        np.stack([col0, row0], 1), np.stack([col1, row0], 1),
+        np.stack([col1, row1], 1), np.stack([col0, row1], 1),
+        np.stack([col0, row0], 1)], axis=1)
+
+    xs, ys = Affine(*scene_index['transform']) * (
+        rings[:, :, 0].ravel(), rings[:, :, 1].ravel())
+    crs = CRS.from_string(scene_index['crs'])
+    map_crs = CRS.from_epsg(4326)
+    if crs != map_crs:
+        xs, ys = transform(crs, map_crs, xs, ys)
+    map_rings = np.stack([xs, ys], axis=1).reshape(rings.shape)
+
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [ring.tolist()]
+            },
+            'properties': {}
+        } for ring in map_rings]
+    }
+
+
+def main():
+    from rastervision.utils.files import str_to_file, json_to_file
+
+    rng = np.random.RandomState(5678)
+    use_remote_data = False
+    test = False
+    vb = VegasBuildings(use_remote_data)
+    # Only training scenes use the AOIs, and the training scenes of a test
+    # experiment are a subset of these.
+    train_ids, _ = get_scene_split(vb, test)
+
+    shifts = [0, 10, 20, 30, 40, 50]
+    probs = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
+    noise_modes = ([NoiseMode(NoiseMode.SHIFT, shift) for shift in shifts] +
+                   [NoiseMode(NoiseMode.DROP, prob) for prob in probs])
+    # If True, select chips once using the original labels, which are the
+    # same as the shift-0 labels, and train every experiment on the same
+    # chips, so only the shift-0 index is built. Otherwise, chips are
+    # selected using the noisy labels of each noise mode, so for drop-*,
+    # chips whose buildings were all dropped are mostly discarded, and the
+    # training set differs between experiments.
+    select_from_clean = True
+    clean_nm = NoiseMode(NoiseMode.SHIFT, 0)
+
+    if select_from_clean:
+        clean_index = build_chip_index(vb, train_ids, clean_nm)
+        json_to_file(clean_index, get_chip_index_uri(clean_nm))
+        clean_keep = select_chips(clean_index, rng)
+
+    for nm in noise_modes:
+        if select_from_clean:
+            # The windows of a scene don't depend on the labels.
+            index, keep = clean_index, clean_keep
+        else:
+            index = build_chip_index(vb, train_ids, nm)
+            json_to_file(index, get_chip_index_uri(nm))
+            keep = select_chips(index, rng)
+        for scene_id, scene_keep in keep.items():
+            aoi = get_chip_aoi(index[scene_id], scene_keep)
+            str_to_file(json.dumps(aoi), vb.get_chip_aoi_uri(nm, scene_id))
+
+
+if __name__ == '__main__':
+    main()
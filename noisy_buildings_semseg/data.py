@@ -1,8 +1,6 @@
 import re
 import os
 
-from rastervision.utils.files import list_paths
-
 # You may need to adjust these URIs.
 remote_root_uri = 's3://raster-vision-lf-dev/noisy-buildings-semseg/'
 local_root_uri = '/opt/data/noisy-buildings-semseg/'
@@ -19,6 +17,13 @@ def get_root_uri(use_remote_data):
 
 
 stats_uri = os.path.join(get_root_uri(False), 'stats.json')
+stream_eval_uri = os.path.join(get_root_uri(False), 'stream-eval.json')
+results_uri = os.path.join(get_root_uri(False), 'results.sqlite')
+
+
+def get_chip_index_uri(noise_mode):
+    return os.path.join(
+        get_root_uri(False), 'chip-index', '{}.json'.format(noise_mode))
 
 
 def get_raw_data_uri(use_remote_data):
@@ -29,9 +34,18 @@ def get_exp_id(noise_mode, run):
     return '{}-{}'.format(noise_mode, run)
 
 
+def get_eval_uri(root_uri, exp_id):
+    return os.path.join(root_uri, rv_output_dir, 'eval', exp_id, 'eval.json')
+
+
 class NoiseMode():
+    # See noise.py for the generator used for each type.
     DROP = 'drop'
     SHIFT = 'shift'
+    BUFFER = 'buffer'
+    JITTER = 'jitter'
+    SIMPLIFY = 'simplify'
+    FALSE_POS = 'false_pos'
 
     def __init__(self, type, level):
         self.type = type
@@ -40,6 +54,13 @@ class NoiseMode():
     def __repr__(self):
         return '{}-{}'.format(self.type, self.level)
 
+    @staticmethod
+    def from_str(s):
+        """Parse the output of str(noise_mode)."""
+        type, level = s.split('-', 1)
+        level = float(level) if '.' in level else int(level)
+        return NoiseMode(type, level)
+
 
 class VegasBuildings():
     def __init__(self, use_remote_data):
@@ -75,7 +96,18 @@ class VegasBuildings():
             self.root_uri, 'noisy-labels', str(noise_mode),
             '{}{}.geojson'.format(self.label_fn_prefix, id))
 
+    def get_chip_aoi_uri(self, noise_mode, id):
+        return os.path.join(
+            self.root_uri, 'chip-aois', str(noise_mode),
+            '{}{}.geojson'.format(self.label_fn_prefix, id))
+
+    def get_prediction_uri(self, exp_id, id):
+        return os.path.join(
+            self.root_uri, rv_output_dir, 'predict', exp_id, '{}.tif'.format(id))
+
     def get_scene_ids(self):
+        from rastervision.utils.files import list_paths
+
         label_dir = os.path.join(self.raw_data_uri, self.label_dir)
         label_paths = list_paths(label_dir, ext='.geojson')
         label_re = re.compile(r'.*{}(\d+)\.geojson'.format(
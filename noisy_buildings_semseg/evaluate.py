@@ -0,0 +1,166 @@
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from noisy_buildings_semseg.data import (
+    VegasBuildings, NoiseMode, get_exp_id, stream_eval_uri)
+from noisy_buildings_semseg.cache import get_cached_path
+from noisy_buildings_semseg.geo import get_label_shapes
+from noisy_buildings_semseg.builders import get_scene_split
+from noisy_buildings_semseg.metrics import (
+    get_conf_mat, get_tolerant_counts, StreamingInstanceCounts,
+    default_tolerance, num_classes)
+
+background_class_id = 2
+
+
+def rasterize_window(shapes, dataset, window):
+    from rasterio.features import rasterize
+
+    out_shape = (window.height, window.width)
+    if len(shapes) == 0:
+        return np.full(out_shape, background_class_id, dtype=np.uint8)
+    return rasterize(
+        shapes, out_shape=out_shape, fill=background_class_id,
+        transform=dataset.window_transform(window), dtype=np.uint8)
+
+
+def get_strip_windows(dataset, min_rows=256):
+    """Return windows of full rows covering the dataset.
+
+    Each window has a whole number of row blocks and at least min_rows rows,
+    so reads are aligned with the blocks of striped GeoTIFFs without reading
+    many tiny windows.
+    """
+    from rasterio.windows import Window
+
+    block_rows = dataset.block_shapes[0][0]
+    strip_rows = block_rows * int(np.ceil(min_rows / block_rows))
+    return [
+        Window(0, row_off, dataset.width,
+               min(strip_rows, dataset.height - row_off))
+        for row_off in range(0, dataset.height, strip_rows)]
+
+
+def get_halo_window(window, halo, dataset):
+    """Return window padded by halo pixels, and slices of the original window.
+
+    The padded window is clipped to the bounds of the dataset.
+    """
+    from rasterio.windows import Window
+
+    row_off = max(window.row_off - halo, 0)
+    col_off = max(window.col_off - halo, 0)
+    row_end = min(window.row_off + window.height + halo, dataset.height)
+    col_end = min(window.col_off + window.width + halo, dataset.width)
+    halo_window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+    inner_row_off = window.row_off - row_off
+    inner_col_off = window.col_off - col_off
+    inner = (slice(inner_row_off, inner_row_off + window.height),
+             slice(inner_col_off, inner_col_off + window.width))
+    return halo_window, inner
+
+
+def evaluate_scene(vb, scene_id, exp_ids, tolerance=default_tolerance):
+    """Return confusion counts and metrics.py counts for a scene for each experiment.
+
+    The predictions of all experiments are read in strips of rows, and each
+    strip of ground truth is rasterized once and compared against all of
+    them, so whole rasters are never loaded. Strips are padded by tolerance
+    rows so that the tolerant counts are exact, and each padded strip of a
+    prediction is read once. Instances can span strips, so they are merged
+    across strips using StreamingInstanceCounts.
+
+    Returns:
+        dict with conf_mat, tolerant_counts and instance_counts, each an array
+        with an entry for each experiment
+    """
+    import rasterio
+
+    conf_mats = np.zeros((len(exp_ids), num_classes, num_classes), dtype=np.int64)
+    tolerant_counts = np.zeros((len(exp_ids), 4), dtype=np.int64)
+    instance_counts = [StreamingInstanceCounts() for _ in exp_ids]
+    pred_uris = [get_cached_path(vb.get_prediction_uri(exp_id, scene_id))
+                 for exp_id in exp_ids]
+
+    with contextlib.ExitStack() as stack:
+        datasets = [stack.enter_context(rasterio.open(uri)) for uri in pred_uris]
+        ref_dataset = datasets[0]
+        shapes = get_label_shapes(
+            vb.get_geojson_uri(scene_id), ref_dataset.crs,
+            vb.get_class_map()['Building'][0])
+
+        for window in get_strip_windows(ref_dataset):
+            halo_window, inner = get_halo_window(window, tolerance, ref_dataset)
+            gt_arr = rasterize_window(shapes, ref_dataset, halo_window)
+            for exp_ind, dataset in enumerate(datasets):
+                pred_arr = dataset.read(1, window=halo_window)
+                conf_mats[exp_ind] += get_conf_mat(gt_arr[inner], pred_arr[inner])
+                tolerant_counts[exp_ind] += get_tolerant_counts(
+                    gt_arr, pred_arr, tolerance, inner=inner)
+                instance_counts[exp_ind].add_strip(gt_arr[inner], pred_arr[inner])
+
+    return {
+        'conf_mat': conf_mats,
+        'tolerant_counts': tolerant_counts,
+        'instance_counts': np.array([c.get_counts() for c in instance_counts])
+    }
+
+
+def evaluate(vb, scene_ids, exp_ids, num_workers=None):
+    """Evaluate the predictions of all experiments over scene_ids.
+
+    Scenes are evaluated in parallel processes.
+
+    Returns:
+        dict from exp_id to dict with the overall conf_mat, tolerant_counts
+        and instance_counts, and a dict of them for each scene
+    """
+    keys = ['conf_mat', 'tolerant_counts', 'instance_counts']
+    results = {exp_id: {'scenes': {}} for exp_id in exp_ids}
+
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = [
+            executor.submit(evaluate_scene, vb, scene_id, exp_ids)
+            for scene_id in scene_ids]
+        for scene_id, future in zip(scene_ids, futures):
+            print('Evaluating scene {}...'.format(scene_id))
+            scene_result = future.result()
+            for exp_ind, exp_id in enumerate(exp_ids):
+                exp_result = results[exp_id]
+                exp_result['scenes'][scene_id] = {
+                    key: scene_result[key][exp_ind].tolist() for key in keys}
+                for key in keys:
+                    exp_result[key] = (
+                        exp_result.get(key, 0) + scene_result[key][exp_ind])
+
+    for exp_result in results.values():
+        for key in keys:
+            exp_result[key] = np.asarray(exp_result.get(key, [])).tolist()
+    return results
+
+
+def main():
+    from rastervision.utils.files import json_to_file
+
+    use_remote_data = True
+    test = False
+    vb = VegasBuildings(use_remote_data)
+    _, scene_ids = get_scene_split(vb, test)
+
+    shifts = [0, 10, 20, 30, 40, 50]
+    probs = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
+    runs = [0]
+
+    noise_modes = ([NoiseMode(NoiseMode.SHIFT, shift) for shift in shifts] +
+                   [NoiseMode(NoiseMode.DROP, prob) for prob in probs])
+    exp_ids = [get_exp_id(nm, run) for nm in noise_modes for run in runs]
+
+    results = evaluate(vb, scene_ids, exp_ids)
+    json_to_file(results, stream_eval_uri)
+
+
+if __name__ == '__main__':
+    main()
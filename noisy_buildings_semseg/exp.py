@@ -1,141 +1,14 @@
-import random
 import os
 
 import rastervision as rv
 from noisy_buildings_semseg.data import (
     VegasBuildings, get_root_uri, get_exp_id, NoiseMode, rv_output_dir)
-
-
-def build_scene(task, spacenet_config, noise_mode, id, is_validation):
-    raster_source = rv.RasterSourceConfig.builder(rv.RASTERIO_SOURCE) \
-                      .with_uri(spacenet_config.get_raster_source_uri(id)) \
-                      .with_channel_order([0, 1, 2]) \
-                      .with_stats_transformer() \
-                      .build()
-
-    vector_source = (spacenet_config.get_geojson_uri(id) if is_validation else
-                     spacenet_config.get_noisy_geojson_uri(noise_mode, id))
-    background_class_id = 2
-    label_raster_source = rv.RasterSourceConfig.builder(rv.RASTERIZED_SOURCE) \
-        .with_vector_source(vector_source) \
-        .with_rasterizer_options(background_class_id) \
-        .build()
-    label_source = rv.LabelSourceConfig.builder(rv.SEMANTIC_SEGMENTATION) \
-        .with_raster_source(label_raster_source) \
-        .build()
-
-    scene = rv.SceneConfig.builder() \
-                          .with_task(task) \
-                          .with_id(id) \
-                          .with_raster_source(raster_source) \
-                          .with_label_source(label_source) \
-                          .build()
-
-    return scene
-
-
-def build_dataset(task, spacenet_config, test, noise_mode):
-    scene_ids = spacenet_config.get_scene_ids()
-    if len(scene_ids) == 0:
-        raise ValueError('No scenes found. Something is configured incorrectly.')
-    scene_ids.sort()
-    random.seed(5678)
-    random.shuffle(scene_ids)
-    train_prop = 0.8
-
-    num_ids = len(scene_ids)
-    # Use subset of scenes.
-    num_ids = 1000
-    if test:
-        num_ids = 20
-    num_train_ids = round(num_ids * train_prop)
-    num_val_ids = num_ids - num_train_ids
-    train_ids = scene_ids[0:num_train_ids]
-    val_ids = scene_ids[num_train_ids:num_train_ids+num_val_ids]
-
-    is_validation = False
-    train_scenes = [build_scene(task, spacenet_config, noise_mode, id, is_validation)
-                    for id in train_ids]
-    is_validation = True
-    val_scenes = [build_scene(task, spacenet_config, noise_mode, id, is_validation)
-                  for id in val_ids]
-    dataset = rv.DatasetConfig.builder() \
-                              .with_train_scenes(train_scenes) \
-                              .with_validation_scenes(val_scenes) \
-                              .build()
-
-    return dataset
-
-
-def build_task(class_map):
-    task = rv.TaskConfig.builder(rv.SEMANTIC_SEGMENTATION) \
-                        .with_chip_size(300) \
-                        .with_classes(class_map) \
-                        .with_chip_options(
-                            window_method='sliding',
-                            stride=300) \
-                        .build()
-    return task
-
-
-def build_deeplab_backend(task, test):
-    debug = False
-    batch_size = 8
-    num_steps = 30000
-    if test:
-        debug = True
-        num_steps = 1
-        batch_size = 1
-
-    backend = rv.BackendConfig.builder(rv.TF_DEEPLAB) \
-                              .with_task(task) \
-                              .with_model_defaults(rv.MOBILENET_V2) \
-                              .with_num_steps(num_steps) \
-                              .with_batch_size(batch_size) \
-                              .with_debug(debug) \
-                              .build()
-
-    return backend
-
-
-def build_fastai_backend(task, test):
-    debug = False
-    batch_sz = 8
-    num_epochs = 10
-    if test:
-        debug = True
-        batch_sz = 1
-        num_epochs = 1
-
-    config = {
-        'batch_sz': batch_sz,
-        'num_epochs': num_epochs,
-        'debug': debug,
-        'lr': 1e-4,
-        'sync_interval': 10,
-        'model_arch': 'resnet18'
-    }
-
-    backend = rv.BackendConfig.builder('FASTAI_SEMANTIC_SEGMENTATION') \
-                              .with_task(task) \
-                              .with_train_options(**config) \
-                              .build()
-    return backend
-
-
-def str_to_bool(x):
-    if type(x) == str:
-        if x.lower() == 'true':
-            return True
-        elif x.lower() == 'false':
-            return False
-        else:
-            raise ValueError('{} is expected to be true or false'.format(x))
-    return x
+from noisy_buildings_semseg.builders import (
+    build_task, build_dataset, build_fastai_backend, str_to_bool)
 
 
 class NoisyBuildingsSemseg(rv.ExperimentSet):
-    def exp_main(self, use_remote_data=True, test=False):
+    def exp_main(self, use_remote_data=True, test=False, filter_chips=False):
         """Run experiments on the Spacenet Vegas building semantic segmentation dataset.
 
         Each experiment using a different set of labels which were created from the
@@ -147,9 +20,12 @@ class NoisyBuildingsSemseg(rv.ExperimentSet):
                 else local
             test: (bool or str) if True or 'True', run a very small experiment as a
                 test and generate debug output
+            filter_chips: (bool or str) if True or 'True', only train on the chips
+                selected by chip_index.py, which drops most chips without buildings
         """
         test = str_to_bool(test)
         use_remote_data = str_to_bool(use_remote_data)
+        filter_chips = str_to_bool(filter_chips)
         root_uri = get_root_uri(use_remote_data)
         root_uri = os.path.join(root_uri, rv_output_dir)
         spacenet_config = VegasBuildings(use_remote_data)
@@ -178,7 +54,8 @@ class NoisyBuildingsSemseg(rv.ExperimentSet):
                 backend = build_fastai_backend(task, test)
                 analyzer = rv.AnalyzerConfig.builder(rv.STATS_ANALYZER) \
                                             .build()
-                dataset = build_dataset(task, spacenet_config, test, nm)
+                dataset = build_dataset(
+                    task, spacenet_config, test, nm, filter_chips=filter_chips)
 
                 experiment = rv.ExperimentConfig.builder() \
                                                 .with_id(exp_id) \
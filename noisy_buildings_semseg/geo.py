@@ -0,0 +1,19 @@
+import json
+
+from noisy_buildings_semseg.cache import cached_file_to_str
+
+
+def get_label_shapes(labels_uri, crs, building_class_id):
+    """Return (geometry, class id) pairs of labels in the CRS of a raster."""
+    from rasterio.crs import CRS
+    from rasterio.warp import transform_geom
+
+    map_crs = CRS.from_epsg(4326)
+    geojson = json.loads(cached_file_to_str(labels_uri))
+    shapes = []
+    for f in geojson['features']:
+        geom = f['geometry']
+        if crs != map_crs:
+            geom = transform_geom(map_crs, crs, geom)
+        shapes.append((geom, building_class_id))
+    return shapes
@@ -0,0 +1,251 @@
+import numpy as np
+
+# Class ids are 1 (building) and 2 (background), and 0 is nodata.
+num_classes = 3
+building_class_id = 1
+# Distance in pixels within which a building pixel counts as correct. At the
+# 0.3m resolution of Spacenet Vegas, this is about 1m.
+default_tolerance = 3
+default_iou_thresh = 0.5
+
+
+def get_conf_mat(gt_arr, pred_arr):
+    """Return confusion counts with ground truth rows and prediction columns.
+
+    Pixels with class ids outside [0, num_classes), such as nodata values,
+    are not counted.
+    """
+    gt_arr = gt_arr.ravel().astype(np.int64)
+    pred_arr = pred_arr.ravel().astype(np.int64)
+    valid = ((gt_arr >= 0) & (gt_arr < num_classes) & (pred_arr >= 0) &
+             (pred_arr < num_classes))
+    inds = gt_arr[valid] * num_classes + pred_arr[valid]
+    return np.bincount(
+        inds, minlength=num_classes ** 2).reshape((num_classes, num_classes))
+
+
+def get_distances(mask):
+    """Return the distance of each pixel to the nearest True pixel in mask."""
+    from scipy import ndimage
+
+    if not mask.any():
+        return np.full(mask.shape, np.inf)
+    return ndimage.distance_transform_edt(~mask)
+
+
+def get_tolerant_counts(gt_arr, pred_arr, tolerance=default_tolerance,
+                        inner=None):
+    """Return building pixel counts for F1 with a tolerance band.
+
+    A predicted building pixel is correct if there is a ground truth building
+    pixel within tolerance pixels, and vice versa. The counts can be summed
+    over windows and scenes.
+
+    Args:
+        gt_arr: array of ground truth class ids
+        pred_arr: array of predicted class ids
+        tolerance: distance in pixels
+        inner: optional tuple of slices of the arrays to count pixels in. The
+            rest of the arrays is a halo used for computing distances, which
+            allows computing counts window by window.
+
+    Returns:
+        [# pred building pixels near a gt building, # pred building pixels,
+         # gt building pixels near a pred building, # gt building pixels]
+    """
+    gt_mask = np.squeeze(gt_arr) == building_class_id
+    pred_mask = np.squeeze(pred_arr) == building_class_id
+    gt_near = get_distances(gt_mask) <= tolerance
+    pred_near = get_distances(pred_mask) <= tolerance
+
+    if inner is not None:
+        gt_mask, pred_mask = gt_mask[inner], pred_mask[inner]
+        gt_near, pred_near = gt_near[inner], pred_near[inner]
+
+    return np.array([
+        np.sum(pred_mask & gt_near), np.sum(pred_mask),
+        np.sum(gt_mask & pred_near), np.sum(gt_mask)], dtype=np.int64)
+
+
+def label_instances(arr):
+    """Return the connected components of building pixels and their number."""
+    from scipy import ndimage
+
+    arr = np.asarray(arr)
+    return ndimage.label(arr.reshape(arr.shape[-2:]) == building_class_id)
+
+
+def get_overlaps(gt_labels, pred_labels, num_pred):
+    """Return the pairs of instances which share pixels.
+
+    Returns:
+        (gt ids, pred ids, # shared pixels) of each pair
+    """
+    overlap = (gt_labels > 0) & (pred_labels > 0)
+    pair_codes = (gt_labels[overlap].astype(np.int64) * (num_pred + 1) +
+                  pred_labels[overlap])
+    pair_codes, inters = np.unique(pair_codes, return_counts=True)
+    return pair_codes // (num_pred + 1), pair_codes % (num_pred + 1), inters
+
+
+def match_instances(gt_areas, pred_areas, gt_ids, pred_ids, inters,
+                    iou_thresh=default_iou_thresh):
+    """Return instance counts given the areas and overlaps of instances.
+
+    Args:
+        gt_areas: area of each gt instance, indexed by id, where id 0 is
+            ignored
+        pred_areas: area of each pred instance, indexed by id
+        gt_ids, pred_ids, inters: output of get_overlaps, where each pair
+            appears once
+
+    Returns:
+        see get_instance_counts
+    """
+    num_gt, num_pred = len(gt_areas) - 1, len(pred_areas) - 1
+    ious = inters / (gt_areas[gt_ids] + pred_areas[pred_ids] - inters)
+    matched = ious > iou_thresh
+    num_matched = np.sum(matched)
+
+    return np.array([
+        num_matched, num_pred - num_matched, num_gt - num_matched,
+        np.sum(ious[matched])])
+
+
+def get_instance_counts(gt_arr, pred_arr, iou_thresh=default_iou_thresh):
+    """Return counts for matching building instances by IoU.
+
+    Instances are the connected components of building pixels. Only pairs of
+    instances which share pixels are considered, and they are found in a
+    single pass over the pixels, so this is linear in the size of the arrays
+    and the number of instances. Pairs match if their IoU > iou_thresh, and
+    with iou_thresh >= 0.5, each instance can match at most one other, so no
+    assignment step is needed.
+
+    Returns:
+        [# matched instances, # unmatched pred instances,
+         # unmatched gt instances, sum of IoU of matched instances]
+    """
+    gt_labels, num_gt = label_instances(gt_arr)
+    pred_labels, num_pred = label_instances(pred_arr)
+    gt_areas = np.bincount(gt_labels.ravel(), minlength=num_gt + 1)
+    pred_areas = np.bincount(pred_labels.ravel(), minlength=num_pred + 1)
+    return match_instances(
+        gt_areas, pred_areas, *get_overlaps(gt_labels, pred_labels, num_pred),
+        iou_thresh=iou_thresh)
+
+
+class StripInstances():
+    """Instances of a raster which is labeled in strips of rows.
+
+    Each strip is labeled separately, and instances which touch across the
+    boundary between consecutive strips are merged at the end, so the result
+    is the same as labeling the whole raster.
+    """
+    def __init__(self):
+        self.num_instances = 0
+        self.areas = [np.zeros(1, dtype=np.int64)]
+        self.seam_pairs = []
+        self.last_row = None
+
+    def add_strip(self, arr):
+        """Label the strip below the previous one.
+
+        Returns:
+            array of the ids of the instances in the strip, where 0 is not a
+            building
+        """
+        labels, num_labels = label_instances(arr)
+        labels = np.where(
+            labels > 0, labels + self.num_instances, 0).astype(np.int64)
+        self.areas.append(np.bincount(
+            labels.ravel(), minlength=self.num_instances + num_labels + 1)[
+                self.num_instances + 1:])
+
+        # Pixels are 4-connected, so instances touch across the seam where a
+        # pixel and the one above it are both buildings.
+        if self.last_row is not None:
+            touching = (self.last_row > 0) & (labels[0] > 0)
+            self.seam_pairs.append(
+                np.stack([self.last_row[touching], labels[0][touching]], 1))
+        self.last_row = labels[-1]
+        self.num_instances += num_labels
+        return labels
+
+    def get_roots(self):
+        """Return the id of each instance after merging across seams."""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        num_ids = self.num_instances + 1
+        pairs = np.concatenate(
+            self.seam_pairs + [np.zeros((0, 2), dtype=np.int64)])
+        graph = coo_matrix(
+            (np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+            shape=(num_ids, num_ids))
+        _, roots = connected_components(graph, directed=False)
+        # Component 0 contains only id 0, which stays the id of non-buildings.
+        return roots
+
+    def get_areas(self, roots):
+        return np.bincount(
+            roots, weights=np.concatenate(self.areas), minlength=roots.max() + 1)
+
+
+class StreamingInstanceCounts():
+    """Instance counts of a scene which is read in strips of rows.
+
+    This gives the same result as get_instance_counts on the whole scene,
+    without loading it all at once.
+    """
+    def __init__(self, iou_thresh=default_iou_thresh):
+        self.iou_thresh = iou_thresh
+        self.gt_instances = StripInstances()
+        self.pred_instances = StripInstances()
+        self.overlaps = []
+
+    def add_strip(self, gt_arr, pred_arr):
+        gt_labels = self.gt_instances.add_strip(gt_arr)
+        pred_labels = self.pred_instances.add_strip(pred_arr)
+        self.overlaps.append(get_overlaps(
+            gt_labels, pred_labels, self.pred_instances.num_instances))
+
+    def get_counts(self):
+        gt_roots = self.gt_instances.get_roots()
+        pred_roots = self.pred_instances.get_roots()
+        gt_ids, pred_ids, inters = [
+            np.concatenate([o[i] for o in self.overlaps] +
+                           [np.zeros(0, dtype=np.int64)])
+            for i in range(3)]
+
+        # Instances split across strips can overlap in several strips.
+        num_pred = pred_roots.max()
+        pair_codes = gt_roots[gt_ids] * (num_pred + 1) + pred_roots[pred_ids]
+        pair_codes, pair_inds = np.unique(pair_codes, return_inverse=True)
+        inters = np.bincount(pair_inds, weights=inters)
+        return match_instances(
+            self.gt_instances.get_areas(gt_roots),
+            self.pred_instances.get_areas(pred_roots),
+            pair_codes // (num_pred + 1), pair_codes % (num_pred + 1), inters,
+            iou_thresh=self.iou_thresh)
+
+
+def get_tolerant_f1s(counts):
+    """Return building F1 for each row of tolerant counts."""
+    counts = np.array(counts, dtype=float).reshape((-1, 4))
+    precs = counts[:, 0] / counts[:, 1]
+    recalls = counts[:, 2] / counts[:, 3]
+    return 2 * (precs * recalls) / (precs + recalls)
+
+
+def get_instance_f1s(counts):
+    """Return instance F1 for each row of instance counts."""
+    counts = np.array(counts, dtype=float).reshape((-1, 4))
+    tps = counts[:, 0]
+    return 2 * tps / (2 * tps + counts[:, 1] + counts[:, 2])
+
+
+def get_mean_ious(counts):
+    """Return mean IoU of matched instances for each row of instance counts."""
+    counts = np.array(counts, dtype=float).reshape((-1, 4))
+    return counts[:, 3] / counts[:, 0]
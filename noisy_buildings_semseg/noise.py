@@ -0,0 +1,466 @@
+import numpy as np
+
+from noisy_buildings_semseg.data import NoiseMode
+
+noise_generators = {}
+
+
+def register_noise_generator(noise_type):
+    """Register a function as the noise generator for noise_type.
+
+    A generator takes (geoms, level, rng), where geoms is a SceneGeometries
+    in pixel coordinates, level is the NoiseMode level, and rng is a
+    np.random.RandomState, and returns a new SceneGeometries.
+    """
+    def _register(generator):
+        noise_generators[noise_type] = generator
+        return generator
+    return _register
+
+
+def make_noisy_geoms(geoms, noise_mode, rng):
+    generator = noise_generators.get(noise_mode.type)
+    if generator is None:
+        raise ValueError('No noise generator for {}'.format(noise_mode.type))
+    return generator(geoms, noise_mode.level, rng)
+
+
+def get_ranges(starts, lengths):
+    """Concatenate np.arange(start, start + length) for each start, length."""
+    lengths = np.asarray(lengths, dtype=int)
+    ends = np.cumsum(lengths)
+    shifts = np.repeat(np.asarray(starts, dtype=int) - (ends - lengths), lengths)
+    return shifts + np.arange(ends[-1] if len(ends) > 0 else 0)
+
+
+def lengths_to_offsets(lengths):
+    return np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+
+
+class SceneGeometries():
+    """The polygons of all features in a scene, packed into flat arrays.
+
+    coords is an (N, 2) array of the pixel coordinates of every ring. Rings
+    are closed, so the last coordinate of each ring equals the first. The
+    coordinates of ring i are coords[ring_offsets[i]:ring_offsets[i+1]],
+    the rings of polygon j are ring_offsets[poly_offsets[j]:poly_offsets[j+1]],
+    and the first ring of each polygon is its exterior. Similarly,
+    feat_offsets indexes the polygons of each feature.
+    """
+    def __init__(self, coords, ring_offsets, poly_offsets, feat_offsets,
+                 geom_types, properties, extent):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.poly_offsets = poly_offsets
+        self.feat_offsets = feat_offsets
+        self.geom_types = geom_types
+        self.properties = properties
+        # (height, width) of the scene in pixels
+        self.extent = extent
+
+    @property
+    def num_features(self):
+        return len(self.feat_offsets) - 1
+
+    @property
+    def ring_lengths(self):
+        return np.diff(self.ring_offsets)
+
+    def get_coord_ring_ids(self):
+        return np.repeat(np.arange(len(self.ring_offsets) - 1), self.ring_lengths)
+
+    def get_ring_poly_ids(self):
+        return np.repeat(
+            np.arange(len(self.poly_offsets) - 1), np.diff(self.poly_offsets))
+
+    def get_poly_feat_ids(self):
+        return np.repeat(np.arange(self.num_features), np.diff(self.feat_offsets))
+
+    def get_coord_feat_ids(self):
+        ring_feat_ids = self.get_poly_feat_ids()[self.get_ring_poly_ids()]
+        return ring_feat_ids[self.get_coord_ring_ids()]
+
+    def with_coords(self, coords):
+        return SceneGeometries(
+            coords, self.ring_offsets, self.poly_offsets, self.feat_offsets,
+            self.geom_types, self.properties, self.extent)
+
+    def take_features(self, feat_inds):
+        """Return the features at feat_inds, which may contain repeats."""
+        feat_inds = np.asarray(feat_inds, dtype=int)
+        poly_counts = np.diff(self.feat_offsets)[feat_inds]
+        poly_inds = get_ranges(self.feat_offsets[feat_inds], poly_counts)
+        ring_counts = np.diff(self.poly_offsets)[poly_inds]
+        ring_inds = get_ranges(self.poly_offsets[poly_inds], ring_counts)
+        coord_counts = self.ring_lengths[ring_inds]
+        coord_inds = get_ranges(self.ring_offsets[ring_inds], coord_counts)
+
+        return SceneGeometries(
+            self.coords[coord_inds], lengths_to_offsets(coord_counts),
+            lengths_to_offsets(ring_counts), lengths_to_offsets(poly_counts),
+            [self.geom_types[i] for i in feat_inds],
+            [self.properties[i] for i in feat_inds], self.extent)
+
+    def filter_rings(self, ring_mask):
+        """Remove rings where ring_mask is False.
+
+        Removing the exterior of a polygon removes the whole polygon, and
+        features without any polygons are removed.
+        """
+        num_polys = len(self.poly_offsets) - 1
+        poly_mask = ring_mask[self.poly_offsets[:-1]]
+        ring_poly_ids = self.get_ring_poly_ids()
+        ring_mask = ring_mask & poly_mask[ring_poly_ids]
+        poly_feat_ids = self.get_poly_feat_ids()
+        feat_mask = np.bincount(
+            poly_feat_ids[poly_mask], minlength=self.num_features) > 0
+
+        ring_counts = np.bincount(
+            ring_poly_ids[ring_mask], minlength=num_polys)[poly_mask]
+        poly_counts = np.bincount(
+            poly_feat_ids[poly_mask], minlength=self.num_features)[feat_mask]
+        coord_mask = np.repeat(ring_mask, self.ring_lengths)
+        feat_inds = np.flatnonzero(feat_mask)
+
+        return SceneGeometries(
+            self.coords[coord_mask],
+            lengths_to_offsets(self.ring_lengths[ring_mask]),
+            lengths_to_offsets(ring_counts), lengths_to_offsets(poly_counts),
+            [self.geom_types[i] for i in feat_inds],
+            [self.properties[i] for i in feat_inds], self.extent)
+
+    def concatenate(self, other):
+        return SceneGeometries(
+            np.concatenate([self.coords, other.coords]),
+            lengths_to_offsets(np.concatenate(
+                [self.ring_lengths, other.ring_lengths])),
+            lengths_to_offsets(np.concatenate(
+                [np.diff(self.poly_offsets), np.diff(other.poly_offsets)])),
+            lengths_to_offsets(np.concatenate(
+                [np.diff(self.feat_offsets), np.diff(other.feat_offsets)])),
+            self.geom_types + other.geom_types,
+            self.properties + other.properties, self.extent)
+
+    @staticmethod
+    def from_features(features, map_to_pixel, extent):
+        """Pack GeoJSON features into a SceneGeometries.
+
+        Args:
+            features: list of GeoJSON features
+            map_to_pixel: function from an (N, 2) array of map coordinates to
+                an (N, 2) array of pixel coordinates
+            extent: (height, width) of the scene in pixels
+        """
+        rings = []
+        ring_counts = []
+        poly_counts = []
+        geom_types = []
+        properties = []
+        for f in features:
+            geom_type = f['geometry']['type']
+            if geom_type == 'Polygon':
+                polys = [f['geometry']['coordinates']]
+            elif geom_type == 'MultiPolygon':
+                polys = f['geometry']['coordinates']
+            else:
+                print('Skipping ' + geom_type)
+                continue
+            polys = [poly for poly in polys if len(poly) > 0]
+            if len(polys) == 0:
+                continue
+
+            for poly in polys:
+                rings.extend(poly)
+                ring_counts.append(len(poly))
+            poly_counts.append(len(polys))
+            geom_types.append(geom_type)
+            properties.append(f['properties'])
+
+        ring_lengths = [len(ring) for ring in rings]
+        if len(rings) > 0:
+            # Drop any z coordinates.
+            coords = np.concatenate(
+                [np.asarray(ring, dtype=float)[:, 0:2] for ring in rings])
+            coords = map_to_pixel(coords)
+        else:
+            coords = np.zeros((0, 2))
+
+        return SceneGeometries(
+            coords, lengths_to_offsets(ring_lengths),
+            lengths_to_offsets(ring_counts), lengths_to_offsets(poly_counts),
+            geom_types, properties, extent)
+
+    def to_features(self, pixel_to_map):
+        map_coords = pixel_to_map(self.coords)
+        rings = [r.tolist() for r in np.split(map_coords, self.ring_offsets[1:-1])]
+        polys = [rings[s:e] for s, e in
+                 zip(self.poly_offsets[:-1], self.poly_offsets[1:])]
+
+        features = []
+        for feat_ind in range(self.num_features):
+            start, end = self.feat_offsets[feat_ind:feat_ind + 2]
+            if self.geom_types[feat_ind] == 'Polygon':
+                coordinates = polys[start]
+            else:
+                coordinates = polys[start:end]
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': self.geom_types[feat_ind],
+                    'coordinates': coordinates
+                },
+                'properties': self.properties[feat_ind]
+            })
+        return features
+
+
+def open_rings(geoms):
+    """Return the coordinates without the closing one, and ring lengths."""
+    ring_lengths = geoms.ring_lengths - 1
+    coords = geoms.coords[get_ranges(geoms.ring_offsets[:-1], ring_lengths)]
+    return coords, ring_lengths
+
+
+def close_rings(geoms, coords, ring_lengths):
+    """Return geoms with open ring coordinates, closing each ring."""
+    starts = lengths_to_offsets(ring_lengths)[:-1]
+    closed_offsets = lengths_to_offsets(ring_lengths + 1)
+    closed_coords = np.empty((closed_offsets[-1], 2))
+    closed_coords[get_ranges(closed_offsets[:-1], ring_lengths)] = coords
+    closed_coords[closed_offsets[1:] - 1] = coords[starts]
+    return SceneGeometries(
+        closed_coords, closed_offsets, geoms.poly_offsets, geoms.feat_offsets,
+        geoms.geom_types, geoms.properties, geoms.extent)
+
+
+def get_neighbors(ring_lengths):
+    """Return indices of the previous and next coordinate within open rings."""
+    starts = np.repeat(lengths_to_offsets(ring_lengths)[:-1], ring_lengths)
+    lengths = np.repeat(ring_lengths, ring_lengths)
+    pos = np.arange(len(starts)) - starts
+    return starts + (pos - 1) % lengths, starts + (pos + 1) % lengths
+
+
+def get_signed_areas(coords, ring_lengths):
+    """Return the signed area of each open ring using the shoelace formula."""
+    _, next_inds = get_neighbors(ring_lengths)
+    next_coords = coords[next_inds]
+    cross = coords[:, 0] * next_coords[:, 1] - next_coords[:, 0] * coords[:, 1]
+    ring_ids = np.repeat(np.arange(len(ring_lengths)), ring_lengths)
+    return 0.5 * np.bincount(ring_ids, weights=cross, minlength=len(ring_lengths))
+
+
+def get_self_intersections(coords, ring_lengths):
+    """Return whether each open ring has edges which cross each other.
+
+    Every pair of edges in a ring is tested, which is cheap since buildings
+    have few vertices. Edges which only touch or overlap are not counted.
+    """
+    _, next_inds = get_neighbors(ring_lengths)
+    coord_ring_ids = np.repeat(np.arange(len(ring_lengths)), ring_lengths)
+    starts = lengths_to_offsets(ring_lengths)[:-1][coord_ring_ids]
+    lengths = ring_lengths[coord_ring_ids]
+    edge1 = np.repeat(np.arange(len(coords)), lengths)
+    edge2 = get_ranges(starts, lengths)
+    is_pair = ((edge1 < edge2) & (next_inds[edge1] != edge2) &
+               (next_inds[edge2] != edge1))
+    edge1, edge2 = edge1[is_pair], edge2[is_pair]
+
+    def get_sides(a, b, c):
+        ab, ac = b - a, c - a
+        return np.sign(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+
+    a, b = coords[edge1], coords[next_inds[edge1]]
+    c, d = coords[edge2], coords[next_inds[edge2]]
+    crosses = ((get_sides(a, b, c) * get_sides(a, b, d) < 0) &
+               (get_sides(c, d, a) * get_sides(c, d, b) < 0))
+    return np.bincount(
+        coord_ring_ids[edge1], weights=crosses,
+        minlength=len(ring_lengths)) > 0
+
+
+@register_noise_generator(NoiseMode.DROP)
+def drop(geoms, level, rng):
+    """Drop each feature with probability level."""
+    keep = rng.uniform(0.0, 1.0, size=geoms.num_features) >= level
+    return geoms.take_features(np.flatnonzero(keep))
+
+
+@register_noise_generator(NoiseMode.SHIFT)
+def shift(geoms, level, rng):
+    """Shift each feature by a random number of pixels in [-level, level]."""
+    shifts = np.round(rng.uniform(-level, level, size=(geoms.num_features, 2)))
+    return geoms.with_coords(geoms.coords + shifts[geoms.get_coord_feat_ids()])
+
+
+@register_noise_generator(NoiseMode.BUFFER)
+def buffer(geoms, level, rng):
+    """Dilate polygons by level pixels, or erode them if level is negative.
+
+    Each vertex is moved along its miter, so that its edges move by level
+    pixels. This is only valid while every edge keeps its direction, no
+    edges cross and the ring keeps its orientation. Otherwise, for instance
+    when a ring is offset by more than its inradius, the ring turns inside
+    out, so those rings are buffered with shapely instead, which removes
+    rings that collapse. Rings with corners sharper than 60 degrees, where
+    the miter is more than twice level, are also buffered with shapely,
+    which limits the miter length.
+    """
+    coords, ring_lengths = open_rings(geoms)
+    if len(coords) == 0:
+        return geoms
+    prev_inds, next_inds = get_neighbors(ring_lengths)
+    areas = get_signed_areas(coords, ring_lengths)
+
+    # Exteriors move away from the interior of the polygon, and holes move
+    # towards it. Orientation is not consistent in the input, so use the
+    # sign of the area of each ring to pick the outward normals.
+    is_exterior = np.zeros(len(ring_lengths), dtype=bool)
+    is_exterior[geoms.poly_offsets[:-1]] = True
+    signs = np.where(is_exterior, 1.0, -1.0) * np.sign(areas)
+    signs = np.repeat(signs, ring_lengths)[:, np.newaxis]
+
+    def get_normals(edges):
+        lengths = np.linalg.norm(edges, axis=1, keepdims=True)
+        normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+        return signs * normals / np.maximum(lengths, 1e-9)
+
+    prev_normals = get_normals(coords - coords[prev_inds])
+    next_normals = get_normals(coords[next_inds] - coords)
+    dots = np.sum(prev_normals * next_normals, axis=1, keepdims=True)
+    miters = (prev_normals + next_normals) / np.maximum(1.0 + dots, 1e-9)
+    new_coords = coords + level * miters
+
+    # An edge which flips direction or a change in orientation means the
+    # ring was offset past its inradius, and crossing edges mean part of it
+    # was.
+    edges = coords[next_inds] - coords
+    new_edges = new_coords[next_inds] - new_coords
+    flipped = ((np.sum(edges * new_edges, axis=1) <= 0) &
+               np.any(edges != 0, axis=1))
+    is_sharp = dots[:, 0] < -0.5
+    ring_ids = np.repeat(np.arange(len(ring_lengths)), ring_lengths)
+    invalid = np.bincount(
+        ring_ids, weights=flipped | is_sharp, minlength=len(ring_lengths)) > 0
+    invalid |= (np.sign(get_signed_areas(new_coords, ring_lengths)) !=
+                np.sign(areas))
+    invalid |= get_self_intersections(new_coords, ring_lengths)
+    if invalid.any():
+        new_coords, ring_lengths = buffer_rings(
+            new_coords, ring_lengths, coords, np.flatnonzero(invalid),
+            np.where(is_exterior, level, -level))
+
+    new_areas = np.abs(get_signed_areas(new_coords, ring_lengths))
+    ring_mask = new_areas >= 1.0
+    # Holes which grow past their exterior remove the whole polygon.
+    ring_poly_ids = geoms.get_ring_poly_ids()
+    exterior_areas = new_areas[geoms.poly_offsets[:-1]][ring_poly_ids]
+    swallowed = np.bincount(
+        ring_poly_ids, weights=~is_exterior & (new_areas >= exterior_areas),
+        minlength=len(geoms.poly_offsets) - 1)
+    ring_mask &= ~(is_exterior & (swallowed[ring_poly_ids] > 0))
+    return close_rings(geoms, new_coords, ring_lengths).filter_rings(ring_mask)
+
+
+def buffer_rings(coords, ring_lengths, orig_coords, ring_inds, distances):
+    """Replace rings in ring_inds with the original rings buffered by shapely.
+
+    Rings are buffered as polygons by distances[ring_ind] with mitred joins.
+    Rings which collapse are replaced by a point, which has zero area, and if
+    a ring splits in parts, only the largest is kept.
+
+    Returns:
+        (coords, ring_lengths) of the open rings
+    """
+    from shapely.geometry import Polygon
+
+    offsets = lengths_to_offsets(ring_lengths)
+    rings = np.split(coords, offsets[1:-1])
+    orig_rings = np.split(orig_coords, offsets[1:-1])
+    ring_lengths = ring_lengths.copy()
+    for ring_ind in ring_inds:
+        buffered = Polygon(orig_rings[ring_ind]).buffer(
+            distances[ring_ind], join_style=2)
+        if buffered.is_empty:
+            rings[ring_ind] = np.repeat(orig_rings[ring_ind][:1], 3, axis=0)
+        else:
+            if buffered.geom_type == 'MultiPolygon':
+                buffered = max(buffered.geoms, key=lambda p: p.area)
+            rings[ring_ind] = np.array(buffered.exterior.coords)[:-1]
+        ring_lengths[ring_ind] = len(rings[ring_ind])
+    return np.concatenate(rings), ring_lengths
+
+
+@register_noise_generator(NoiseMode.JITTER)
+def jitter(geoms, level, rng):
+    """Add Gaussian noise with a std of level pixels to each vertex."""
+    coords, ring_lengths = open_rings(geoms)
+    coords = coords + rng.normal(0.0, level, size=coords.shape)
+    return close_rings(geoms, coords, ring_lengths)
+
+
+@register_noise_generator(NoiseMode.SIMPLIFY)
+def simplify(geoms, level, rng):
+    """Simplify rings by removing vertices within level pixels of their neighbors.
+
+    This is a parallel version of the Visvalingam-Whyatt algorithm. In each
+    pass, vertices whose distance to the line through their neighbors is
+    below level are removed if they are a local minimum of that distance, so
+    that adjacent vertices are never removed together. Rings keep at least 3
+    vertices.
+    """
+    coords, ring_lengths = open_rings(geoms)
+    while len(coords) > 0:
+        prev_inds, next_inds = get_neighbors(ring_lengths)
+        prev_coords = coords[prev_inds]
+        base = coords[next_inds] - prev_coords
+        offsets = coords - prev_coords
+        cross = np.abs(base[:, 0] * offsets[:, 1] - base[:, 1] * offsets[:, 0])
+        dists = cross / np.maximum(np.linalg.norm(base, axis=1), 1e-9)
+
+        # Break ties by index so that equal distances are ordered.
+        ranks = np.empty(len(dists), dtype=int)
+        ranks[np.argsort(dists, kind='stable')] = np.arange(len(dists))
+        remove = ((dists < level) & (ranks < ranks[prev_inds]) &
+                  (ranks < ranks[next_inds]))
+
+        ring_ids = np.repeat(np.arange(len(ring_lengths)), ring_lengths)
+        num_removed = np.bincount(
+            ring_ids, weights=remove, minlength=len(ring_lengths))
+        remove &= np.repeat(ring_lengths - num_removed >= 3, ring_lengths)
+        if not remove.any():
+            break
+        coords = coords[~remove]
+        ring_lengths = np.bincount(
+            ring_ids[~remove], minlength=len(ring_lengths))
+
+    return close_rings(geoms, coords, ring_lengths)
+
+
+@register_noise_generator(NoiseMode.FALSE_POS)
+def false_pos(geoms, level, rng):
+    """Add spurious buildings, on average level times the number of features.
+
+    Each spurious building is a copy of a random feature from the scene moved
+    to a random location, so it has a realistic shape and size.
+    """
+    num_new = rng.poisson(level * geoms.num_features)
+    if num_new == 0:
+        return geoms
+
+    new_geoms = geoms.take_features(
+        rng.randint(0, geoms.num_features, size=num_new))
+    coord_feat_ids = new_geoms.get_coord_feat_ids()
+    feat_starts = new_geoms.ring_offsets[
+        new_geoms.poly_offsets[new_geoms.feat_offsets[:-1]]]
+    mins = np.minimum.reduceat(new_geoms.coords, feat_starts)
+    maxs = np.maximum.reduceat(new_geoms.coords, feat_starts)
+
+    # Pick a new location for the bounding box of each copy within the scene.
+    height, width = geoms.extent
+    sizes = maxs - mins
+    new_mins = rng.uniform(0.0, 1.0, size=(num_new, 2)) * np.maximum(
+        np.array([width, height]) - sizes, 0.0)
+    new_geoms = new_geoms.with_coords(
+        new_geoms.coords + (new_mins - mins)[coord_feat_ids])
+    return geoms.concatenate(new_geoms)
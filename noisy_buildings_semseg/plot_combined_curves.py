@@ -1,53 +1,45 @@
-import json
 import os
 
 import numpy as np
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
 
-from rastervision.utils.files import file_to_str, make_dir, file_to_json
-from noisy_buildings_semseg.data import (
-    get_root_uri, get_exp_id, NoiseMode, rv_output_dir, stats_uri)
+from noisy_buildings_semseg.data import get_root_uri, NoiseMode
+from noisy_buildings_semseg.plot_utils import get_pyplot
+from noisy_buildings_semseg.results import (
+    open_store, query, ANALYZE, EVAL, STREAM_EVAL, CONF_MAT, TOLERANT_COUNTS,
+    INSTANCE_COUNTS)
+from noisy_buildings_semseg.metrics import (
+    get_tolerant_f1s, get_instance_f1s)
 
 
 class Stats():
-    def __init__(self, levels, gt_conf_mats, pred_conf_mats):
+    def __init__(self, levels, gt_conf_mats, pred_conf_mats,
+                 gt_tolerant_counts, pred_tolerant_counts,
+                 gt_instance_counts, pred_instance_counts):
         self.levels = np.array(levels)
         self.gt_conf_mats = np.array(gt_conf_mats)
         self.pred_conf_mats = np.array(pred_conf_mats)
+        self.gt_tolerant_counts = np.array(gt_tolerant_counts)
+        self.pred_tolerant_counts = np.array(pred_tolerant_counts)
+        self.gt_instance_counts = np.array(gt_instance_counts)
+        self.pred_instance_counts = np.array(pred_instance_counts)
 
 
-def get_stats(root_uri, noise_type, levels, runs, level_metrics_dict):
-    num_runs = len(runs)
-    gt_conf_mats = []
-    pred_conf_mats = []
+def get_stats(conn, noise_type, levels, runs):
+    """Get stats for the labels and predictions at each level from the results store.
 
-    for level in levels:
-        noise_mode = NoiseMode(noise_type, level)
-        pred_conf_mat = np.zeros((3, 3))
-        for run in runs:
-            exp_id = get_exp_id(noise_mode, run)
-            eval_uri = os.path.join(
-                root_uri, rv_output_dir, 'eval', exp_id, 'eval.json')
-            eval_json = json.loads(file_to_str(eval_uri))
+    Prediction confusion matrices come from RV's eval.json, and prediction
+    tolerant and instance counts come from evaluate.py, and are NaN if it
+    hasn't been ingested.
+    """
+    def _query(origin, metric, runs=None):
+        return query(conn, origin, noise_type, levels, metric, runs)
 
-            avg_eval = next(filter(
-                lambda e: e['class_name'] == 'average', eval_json['overall']))
-            # Hack to deal with fact that some experiments were run with
-            # conf_mat with 3 rows (one for the zero class), and some were
-            # run with 2 rows.
-            cm = np.array(avg_eval['conf_mat'])
-            if cm.shape[0] == 3:
-                pred_conf_mat += cm
-            elif cm.shape[0] == 2:
-                pred_conf_mat[1:, :] += cm
-        pred_conf_mat /= num_runs
-
-        pred_conf_mats.append(pred_conf_mat)
-        gt_conf_mats.append(level_metrics_dict[str(noise_mode)])
-
-    return Stats(levels, gt_conf_mats, pred_conf_mats)
+    return Stats(
+        levels, _query(ANALYZE, CONF_MAT), _query(EVAL, CONF_MAT, runs),
+        _query(ANALYZE, TOLERANT_COUNTS),
+        _query(STREAM_EVAL, TOLERANT_COUNTS, runs),
+        _query(ANALYZE, INSTANCE_COUNTS),
+        _query(STREAM_EVAL, INSTANCE_COUNTS, runs))
 
 
 def get_probs(conf_mats, etype):
@@ -72,6 +64,7 @@ def get_building_f1s(conf_mats):
 
 
 def save_prob_plot(plot_uri, noise_type, stats):
+    plt = get_pyplot()
     if noise_type == NoiseMode.DROP:
         title = 'Trained on randomly dropped labels'
     elif noise_type == NoiseMode.SHIFT:
@@ -102,6 +95,8 @@ def save_prob_plot(plot_uri, noise_type, stats):
 
 
 def save_metric_plot(plot_uri, drop_stats, shift_stats, metric='acc'):
+    plt = get_pyplot()
+
     def _plot(stats, label):
         if metric == 'acc':
             x = get_accs(stats.gt_conf_mats)
@@ -113,6 +108,16 @@ def save_metric_plot(plot_uri, drop_stats, shift_stats, metric='acc'):
             y = get_building_f1s(stats.pred_conf_mats)
             xlabel = 'Label Building F1'
             ylabel = 'Prediction Building F1'
+        elif metric == 'tolerant_building_f1':
+            x = get_tolerant_f1s(stats.gt_tolerant_counts)
+            y = get_tolerant_f1s(stats.pred_tolerant_counts)
+            xlabel = 'Label Boundary-Tolerant Building F1'
+            ylabel = 'Prediction Boundary-Tolerant Building F1'
+        elif metric == 'instance_f1':
+            x = get_instance_f1s(stats.gt_instance_counts)
+            y = get_instance_f1s(stats.pred_instance_counts)
+            xlabel = 'Label Building Instance F1'
+            ylabel = 'Prediction Building Instance F1'
 
         plt.plot(x, y, label=label)
         plt.xlabel(xlabel)
@@ -136,18 +141,17 @@ def save_metric_plot(plot_uri, drop_stats, shift_stats, metric='acc'):
 
 
 def main():
-    use_remote_data = True
-    root_uri = get_root_uri(use_remote_data)
-    level_metrics_dict = file_to_json(stats_uri)
+    from rastervision.utils.files import make_dir
+
+    # Run python -m noisy_buildings_semseg.results first to ingest results.
+    conn = open_store()
 
     shifts = [0, 10, 20, 30, 40, 50]
     probs = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
     runs = [0]
 
-    drop_stats = get_stats(
-        root_uri, NoiseMode.DROP, probs, runs, level_metrics_dict)
-    shift_stats = get_stats(
-        root_uri, NoiseMode.SHIFT, shifts, runs, level_metrics_dict)
+    drop_stats = get_stats(conn, NoiseMode.DROP, probs, runs)
+    shift_stats = get_stats(conn, NoiseMode.SHIFT, shifts, runs)
 
     curves_dir = os.path.join(get_root_uri(False), 'plots', 'curves')
     make_dir(curves_dir)
@@ -155,6 +159,14 @@ def main():
     print('Saving plot to {}...'.format(plot_uri))
     save_metric_plot(plot_uri, drop_stats, shift_stats, metric='building_f1')
 
+    has_stream_eval = not np.all(np.isnan(drop_stats.pred_tolerant_counts))
+    if has_stream_eval:
+        for metric in ['tolerant_building_f1', 'instance_f1']:
+            plot_uri = os.path.join(
+                curves_dir, 'plot-combined-{}.png'.format(metric))
+            print('Saving plot to {}...'.format(plot_uri))
+            save_metric_plot(plot_uri, drop_stats, shift_stats, metric=metric)
+
 
 if __name__ == '__main__':
     main()
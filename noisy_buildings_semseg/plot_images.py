@@ -3,20 +3,11 @@ import collections
 import json
 
 import numpy as np
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
-import rasterio
-from shapely.geometry import shape
-
-import rastervision as rv
-from rastervision.rv_config import RVConfig
-from rastervision.data import (
-    ActivateMixin, StatsTransformer, RasterStats, RasterioSource, GeoJSONVectorSource)
-from rastervision.core import ClassMap
-from rastervision.utils.files import make_dir, file_to_str
+
 from noisy_buildings_semseg.data import (
-    get_root_uri, get_exp_id, NoiseMode, VegasBuildings, rv_output_dir)
+    get_root_uri, get_exp_id, NoiseMode, VegasBuildings)
+from noisy_buildings_semseg.cache import get_cached_path
+from noisy_buildings_semseg.plot_utils import get_pyplot
 
 
 NOISY_LABELS = 'noisy-labels'
@@ -27,6 +18,12 @@ ExpData = collections.namedtuple(
 
 
 def get_exp_data(vb, nm, id):
+    from shapely.geometry import shape
+    from rastervision.rv_config import RVConfig
+    from rastervision.data import (
+        ActivateMixin, StatsTransformer, RasterStats, RasterioSource,
+        GeoJSONVectorSource)
+
     tmp_dir_obj = RVConfig.get_tmp_dir()
     tmp_dir = tmp_dir_obj.name
 
@@ -34,12 +31,12 @@ def get_exp_data(vb, nm, id):
     stats = RasterStats()
     stats.means = np.array([462.4939189390183, 633.5548961566001, 464.99947912120706])
     stats.stds = np.array([248.46624190502172, 271.07249107975275, 162.06929299061807])
-    raster_uri = vb.get_raster_source_uri(id)
+    raster_uri = get_cached_path(vb.get_raster_source_uri(id))
     raster_source = RasterioSource([raster_uri], [StatsTransformer(stats)], tmp_dir)
 
     # Get label raster source.
     background_class_id = 2
-    label_uri = vb.get_geojson_uri(id)
+    label_uri = get_cached_path(vb.get_geojson_uri(id))
     '''
     label_raster_source = rv.RasterSourceConfig.builder(rv.RASTERIZED_SOURCE) \
         .with_vector_source(label_uri) \
@@ -54,7 +51,7 @@ def get_exp_data(vb, nm, id):
         label_uri, raster_source.get_crs_transformer()).get_geojson()
     label_geoms = [shape(f['geometry']) for f in label_geojson['features']]
 
-    noisy_label_uri = vb.get_noisy_geojson_uri(nm, id)
+    noisy_label_uri = get_cached_path(vb.get_noisy_geojson_uri(nm, id))
     noisy_label_geojson = GeoJSONVectorSource(
         noisy_label_uri, raster_source.get_crs_transformer()).get_geojson()
     noisy_label_geoms = [shape(f['geometry']) for f in noisy_label_geojson['features']]
@@ -62,8 +59,7 @@ def get_exp_data(vb, nm, id):
     # Get prediction raster source.
     run = 0
     exp_id = get_exp_id(nm, run)
-    prediction_uri = os.path.join(
-        vb.root_uri, rv_output_dir, 'predict', exp_id, '{}.tif'.format(id))
+    prediction_uri = get_cached_path(vb.get_prediction_uri(exp_id, id))
     pred_raster_source = RasterioSource([prediction_uri], [], tmp_dir)
 
     with ActivateMixin.compose(raster_source, pred_raster_source):
@@ -73,7 +69,17 @@ def get_exp_data(vb, nm, id):
             pred_raster_source.get_image_array())
 
 
+def plot_geoms(geoms, color):
+    plt = get_pyplot()
+    for geom in geoms:
+        # Noisy labels can contain MultiPolygons.
+        for polygon in getattr(geom, 'geoms', [geom]):
+            x, y = polygon.exterior.xy
+            plt.plot(x, y, color=color, alpha=0.8, linewidth=0.5)
+
+
 def plot_labels(all_exp_data, noise_type, levels, ids, plot_mode, plot_dir):
+    plt = get_pyplot()
     building_class_id = 1
     subplot_ind = 1
     if plot_mode == NOISY_LABELS:
@@ -90,18 +96,14 @@ def plot_labels(all_exp_data, noise_type, levels, ids, plot_mode, plot_dir):
 
             # Plot ground truth labels
             if not (plot_mode == NOISY_LABELS and noise_type == NoiseMode.DROP):
-                for label_geom in exp_data.label_geoms:
-                    x, y = label_geom.exterior.xy
-                    plt.plot(x, y, color='lightblue', alpha=0.8, linewidth=0.5)
+                plot_geoms(exp_data.label_geoms, 'lightblue')
 
             if plot_mode == NOISY_LABELS:
-                for label_geom in exp_data.noisy_label_geoms:
-                    x, y = label_geom.exterior.xy
-                    plt.plot(x, y, color='orange', alpha=0.8, linewidth=0.5)
+                plot_geoms(exp_data.noisy_label_geoms, 'orange')
 
             elif plot_mode == PREDS:
                 label_arr = np.squeeze(exp_data.pred_arr == building_class_id).astype(int) * 140
-                plt.imshow(label_arr, cmap=mpl.cm.hot, vmin=0, vmax=255, alpha=0.7)
+                plt.imshow(label_arr, cmap=plt.cm.hot, vmin=0, vmax=255, alpha=0.7)
 
             plt.axis('off')
 
@@ -127,6 +129,8 @@ def plot_labels(all_exp_data, noise_type, levels, ids, plot_mode, plot_dir):
 
 
 def main():
+    from rastervision.utils.files import make_dir
+
     use_remote_data = True
     vb = VegasBuildings(use_remote_data)
     plot_dir = os.path.join(get_root_uri(False), 'plots', 'images')
@@ -1,14 +1,10 @@
-import json
 import os
 
 import numpy as np
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
 
-from rastervision.utils.files import file_to_str, make_dir
-from noisy_buildings_semseg.data import (
-    get_root_uri, get_exp_id, NoiseMode, rv_output_dir)
+from noisy_buildings_semseg.data import get_root_uri, NoiseMode
+from noisy_buildings_semseg.plot_utils import get_pyplot
+from noisy_buildings_semseg.results import open_store, query, EVAL, CONF_MAT
 
 
 class Stats():
@@ -19,39 +15,23 @@ class Stats():
         self.f1s = np.array(f1s)
 
 
-def get_stats(root_uri, noise_type, levels, runs):
-    precisions = []
-    recalls = []
-    f1s = []
-    num_runs = len(runs)
-    for level in levels:
-        precision = 0.
-        recall = 0.
-        f1 = 0.
-        for run in runs:
-            noise_mode = NoiseMode(noise_type, level)
-            exp_id = get_exp_id(noise_mode, run)
-            eval_uri = os.path.join(root_uri, rv_output_dir, 'eval', exp_id, 'eval.json')
-            eval_json = json.loads(file_to_str(eval_uri))
-
-            class_id = 1
-            building_eval = next(filter(
-                lambda e: e['class_id'] == class_id, eval_json['overall']))
-            precision += building_eval['precision']
-            recall += building_eval['recall']
-            f1 += building_eval['f1']
-        precision /= num_runs
-        recall /= num_runs
-        f1 /= num_runs
-
-        precisions.append(precision)
-        recalls.append(recall)
-        f1s.append(f1)
+def get_stats(conn, noise_type, levels, runs):
+    """Get building metrics of the predictions at each level from the results store.
+
+    The metrics are computed from the confusion matrices in RV's eval.json
+    averaged over runs.
+    """
+    conf_mats = query(conn, EVAL, noise_type, levels, CONF_MAT, runs)
+    class_id = 1
+    precisions = conf_mats[:, class_id, class_id] / conf_mats[:, :, class_id].sum(axis=1)
+    recalls = conf_mats[:, class_id, class_id] / conf_mats[:, class_id, :].sum(axis=1)
+    f1s = 2 * (precisions * recalls) / (precisions + recalls)
 
     return Stats(levels, precisions, recalls, f1s)
 
 
 def save_plot(plot_uri, noise_type, stats):
+    plt = get_pyplot()
     plt.cla()
     plt.plot(stats.levels, stats.precisions, label='precision')
     plt.plot(stats.levels, stats.recalls, label='recall')
@@ -71,11 +51,13 @@ def save_plot(plot_uri, noise_type, stats):
 
 
 def main():
-    use_remote_data = True
-    root_uri = get_root_uri(use_remote_data)
+    from rastervision.utils.files import make_dir
+
+    # Run python -m noisy_buildings_semseg.results first to ingest results.
+    conn = open_store()
 
     def process_noise_type(noise_type, levels, runs):
-        stats = get_stats(root_uri, noise_type, levels, runs)
+        stats = get_stats(conn, noise_type, levels, runs)
         curves_uri = os.path.join(get_root_uri(False), 'plots', 'curves')
         make_dir(curves_uri)
         plot_uri = os.path.join(curves_uri, 'plot-{}.png'.format(noise_type))
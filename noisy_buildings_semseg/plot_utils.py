@@ -0,0 +1,10 @@
+def get_pyplot():
+    """Import pyplot with a non-interactive backend.
+
+    This is done on first use rather than at module level, since importing
+    matplotlib is slow.
+    """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
@@ -1,63 +1,69 @@
 import json
-import random
 
-import rasterio
-from rastervision.data import RasterioCRSTransformer
-from rastervision.utils.files import file_to_str, str_to_file
+import numpy as np
 
 from noisy_buildings_semseg.data import VegasBuildings, NoiseMode
+from noisy_buildings_semseg.cache import get_cached_path, cached_file_to_str
+from noisy_buildings_semseg.noise import SceneGeometries, make_noisy_geoms
 
 
-def make_noisy_data(scene_ids, vb, noise_mode):
+def get_crs_transforms(dataset):
+    """Return vectorized map_to_pixel and pixel_to_map functions for a dataset.
+
+    These operate on (N, 2) arrays of (x, y) coordinates, and use fractional
+    pixel coordinates.
+    """
+    from rasterio.crs import CRS
+    from rasterio.warp import transform
+
+    map_crs = CRS.from_epsg(4326)
+    image_crs = dataset.crs
+    image_to_pixel = ~dataset.transform
+    pixel_to_image = dataset.transform
+
+    def map_to_pixel(coords):
+        xs, ys = coords[:, 0], coords[:, 1]
+        if image_crs != map_crs:
+            xs, ys = transform(map_crs, image_crs, xs, ys)
+        cols, rows = image_to_pixel * (np.asarray(xs), np.asarray(ys))
+        return np.stack([cols, rows], axis=1)
+
+    def pixel_to_map(coords):
+        xs, ys = pixel_to_image * (coords[:, 0], coords[:, 1])
+        if image_crs != map_crs:
+            xs, ys = transform(image_crs, map_crs, xs, ys)
+        return np.stack([np.asarray(xs), np.asarray(ys)], axis=1)
+
+    return map_to_pixel, pixel_to_map
+
+
+def make_noisy_data(scene_ids, vb, noise_mode, rng):
+    import rasterio
+    from rastervision.utils.files import str_to_file
+
     for scene_id in scene_ids:
         raster_uri = vb.get_raster_source_uri(scene_id)
-        with rasterio.open(raster_uri) as dataset:
-            crs_trans = RasterioCRSTransformer.from_dataset(dataset)
-            labels_uri = vb.get_geojson_uri(scene_id)
-            geojson = json.loads(file_to_str(labels_uri))
-            new_features = []
-            for f in geojson['features']:
-                if noise_mode.type == NoiseMode.DROP:
-                    if random.uniform(0.0, 1.0) < noise_mode.level:
-                        pass
-                    else:
-                        new_features.append(f)
-                elif noise_mode.type == NoiseMode.SHIFT:
-                    if f['geometry']['type'] == 'Polygon':
-                        map_coords_list = [f['geometry']['coordinates'][0]]
-                    elif f['geometry']['type'] == 'MultiPolygon':
-                        map_coords_list = [mc[0] for mc in f['geometry']['coordinates']]
-                    else:
-                        print('Skipping ' + f['geometry']['type'])
-                        continue
-
-                    for map_coords in map_coords_list:
-                        pixel_coords = [crs_trans.map_to_pixel(p) for p in map_coords]
-                        x_shift = round(random.uniform(-noise_mode.level, noise_mode.level))
-                        y_shift = round(random.uniform(-noise_mode.level, noise_mode.level))
-                        shift_coords = [(p[0] + x_shift, p[1] + y_shift) for p in pixel_coords]
-                        shift_map_coords = [crs_trans.pixel_to_map(p) for p in shift_coords]
-
-                        new_f = {
-                            'geometry': {
-                                'type': 'Polygon',
-                                'coordinates': [shift_map_coords]
-                            },
-                            'properties': f['properties']
-                        }
-                        new_features.append(new_f)
-
-            new_geojson = {
-                'type': 'FeatureCollection',
-                'features': new_features
-            }
-            noisy_uri = vb.get_noisy_geojson_uri(noise_mode, scene_id)
-            print(noisy_uri)
-            str_to_file(json.dumps(new_geojson), noisy_uri)
+        with rasterio.open(get_cached_path(raster_uri)) as dataset:
+            map_to_pixel, pixel_to_map = get_crs_transforms(dataset)
+            extent = (dataset.height, dataset.width)
+
+        labels_uri = vb.get_geojson_uri(scene_id)
+        geojson = json.loads(cached_file_to_str(labels_uri))
+        geoms = SceneGeometries.from_features(
+            geojson['features'], map_to_pixel, extent)
+        noisy_geoms = make_noisy_geoms(geoms, noise_mode, rng)
+
+        new_geojson = {
+            'type': 'FeatureCollection',
+            'features': noisy_geoms.to_features(pixel_to_map)
+        }
+        noisy_uri = vb.get_noisy_geojson_uri(noise_mode, scene_id)
+        print(noisy_uri)
+        str_to_file(json.dumps(new_geojson), noisy_uri)
 
 
 def main():
-    random.seed(5678)
+    rng = np.random.RandomState(5678)
     use_remote_data = False
     vb = VegasBuildings(use_remote_data)
     scene_ids = vb.get_scene_ids()
@@ -67,11 +73,11 @@ def main():
 
     for shift in shifts:
         nm = NoiseMode(NoiseMode.SHIFT, shift)
-        make_noisy_data(scene_ids, vb, nm)
+        make_noisy_data(scene_ids, vb, nm, rng)
 
     for prob in probs:
         nm = NoiseMode(NoiseMode.DROP, prob)
-        make_noisy_data(scene_ids, vb, nm)
+        make_noisy_data(scene_ids, vb, nm, rng)
 
 
 if __name__ == '__main__':
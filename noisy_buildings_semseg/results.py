@@ -0,0 +1,279 @@
+import os
+import json
+import sqlite3
+from urllib.parse import urlparse
+
+import numpy as np
+
+from noisy_buildings_semseg.data import (
+    NoiseMode, get_root_uri, get_exp_id, get_eval_uri, stats_uri,
+    stream_eval_uri, results_uri)
+from noisy_buildings_semseg.cache import (
+    is_remote, get_etag, cached_file_to_str)
+from noisy_buildings_semseg.metrics import num_classes, building_class_id
+
+# Where rows come from, which are kept apart since they cover different
+# scenes. analyze compares noisy labels against the original labels, and
+# eval and stream_eval compare predictions against the original labels
+# using RV's eval.json and evaluate.py respectively.
+ANALYZE = 'analyze'
+EVAL = 'eval'
+STREAM_EVAL = 'stream_eval'
+
+# Metrics, where conf_mat rows are stored one row of the confusion matrix per
+# class, and the other metrics are the counts from metrics.py.
+CONF_MAT = 'conf_mat'
+TOLERANT_COUNTS = 'tolerant_counts'
+INSTANCE_COUNTS = 'instance_counts'
+
+# Scene of rows which are totals over all scenes.
+all_scenes = ''
+
+# The store is append-only. Each time a source is ingested, its rows are
+# added under a new ingestion, and queries use the latest_results view, which
+# only has the rows of the latest ingestion of each source.
+schema_version = 1
+schema = '''
+CREATE TABLE IF NOT EXISTS ingestions (
+    ingestion_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_uri TEXT NOT NULL,
+    version TEXT NOT NULL,
+    ingested_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ingestions_source_uri
+    ON ingestions (source_uri, ingestion_id);
+CREATE TABLE IF NOT EXISTS results (
+    ingestion_id INTEGER NOT NULL REFERENCES ingestions (ingestion_id),
+    origin TEXT NOT NULL,
+    noise_type TEXT NOT NULL,
+    level REAL NOT NULL,
+    run INTEGER NOT NULL,
+    scene TEXT NOT NULL,
+    class_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    counts BLOB NOT NULL,
+    PRIMARY KEY (ingestion_id, origin, noise_type, level, run, scene,
+                 class_id, metric)
+);
+CREATE INDEX IF NOT EXISTS results_query
+    ON results (origin, noise_type, metric, level, run);
+CREATE VIEW IF NOT EXISTS latest_results AS
+    SELECT * FROM results WHERE ingestion_id IN (
+        SELECT MAX(ingestion_id) FROM ingestions GROUP BY source_uri);
+'''
+
+
+def open_store(uri=results_uri):
+    os.makedirs(os.path.dirname(uri), exist_ok=True)
+    conn = sqlite3.connect(uri)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    is_empty = conn.execute(
+        'SELECT COUNT(*) FROM sqlite_master').fetchone()[0] == 0
+    if version != schema_version and not is_empty:
+        conn.close()
+        raise ValueError(
+            'Results store {} has schema version {}, but version {} is '
+            'required'.format(uri, version, schema_version))
+    conn.executescript(schema)
+    conn.execute('PRAGMA user_version = {}'.format(schema_version))
+    return conn
+
+
+def get_version(uri):
+    """Return a string that changes when the object at uri changes.
+
+    Returns:
+        the version, or None if there is no object at uri
+    """
+    if not is_remote(uri):
+        if not os.path.isfile(uri):
+            return None
+        return str(os.path.getmtime(uri))
+
+    if urlparse(uri).scheme == 's3':
+        from botocore.exceptions import ClientError
+
+        try:
+            version = get_etag(uri)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                return None
+            raise
+    else:
+        from urllib.error import HTTPError
+
+        try:
+            version = get_etag(uri)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    if version is None:
+        raise ValueError(
+            'Can\'t tell whether {} changed since it has no ETag or '
+            'Last-Modified header'.format(uri))
+    return version
+
+
+def ingest(conn, source_uri, get_rows):
+    """Add the rows derived from source_uri to the store.
+
+    Sources are only read if they changed since they were last ingested, in
+    which case their rows are added as a new ingestion, which supersedes the
+    old rows in latest_results. Sources which don't exist yet are skipped.
+
+    Args:
+        get_rows: function from the contents of source_uri to an iterable of
+            (origin, noise_mode, run, scene, class_id, metric, counts)
+    """
+    version = get_version(source_uri)
+    if version is None:
+        return
+    row = conn.execute(
+        'SELECT version FROM ingestions WHERE source_uri = ? '
+        'ORDER BY ingestion_id DESC LIMIT 1', (source_uri,)).fetchone()
+    if row is not None and row[0] == version:
+        return
+
+    print('Ingesting {}...'.format(source_uri))
+    rows = get_rows(json.loads(cached_file_to_str(source_uri)))
+    with conn:
+        ingestion_id = conn.execute(
+            'INSERT INTO ingestions (source_uri, version) VALUES (?, ?)',
+            (source_uri, version)).lastrowid
+        conn.executemany(
+            'INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(ingestion_id, origin, nm.type, nm.level, run, str(scene),
+              class_id, metric, np.asarray(counts, dtype=np.float64).tobytes())
+             for origin, nm, run, scene, class_id, metric, counts in rows])
+
+
+def get_conf_mat_rows(origin, nm, run, scene, conf_mat):
+    conf_mat = np.array(conf_mat, dtype=np.float64)
+    # Some experiments were run with conf_mat with 3 rows (one for the zero
+    # class), and some were run with 2 rows.
+    first_class_id = num_classes - conf_mat.shape[0]
+    if conf_mat.shape[1] < num_classes:
+        conf_mat = np.pad(
+            conf_mat, ((0, 0), (num_classes - conf_mat.shape[1], 0)), 'constant')
+    for class_ind, counts in enumerate(conf_mat):
+        yield (origin, nm, run, scene, first_class_id + class_ind, CONF_MAT,
+               counts)
+
+
+def get_metric_rows(origin, nm, run, scene, metrics):
+    if CONF_MAT in metrics:
+        yield from get_conf_mat_rows(origin, nm, run, scene, metrics[CONF_MAT])
+    for metric in [TOLERANT_COUNTS, INSTANCE_COUNTS]:
+        if metric in metrics:
+            yield (origin, nm, run, scene, building_class_id, metric,
+                   metrics[metric])
+
+
+def get_stats_rows(stats):
+    """Get rows from the stats.json output of analyze."""
+    # Noisy labels are generated once and shared by all runs.
+    run = 0
+    for nm_str, nm_stats in stats.items():
+        nm = NoiseMode.from_str(nm_str)
+        # Older versions of stats.json only contain the conf_mat.
+        if isinstance(nm_stats, list):
+            nm_stats = {CONF_MAT: nm_stats}
+
+        if 'scenes' in nm_stats:
+            # Use the per-scene conf_mats instead of the total.
+            for scene, conf_mat in nm_stats['scenes'].items():
+                yield from get_conf_mat_rows(ANALYZE, nm, run, scene, conf_mat)
+            nm_stats = {k: v for k, v in nm_stats.items() if k != CONF_MAT}
+        yield from get_metric_rows(ANALYZE, nm, run, all_scenes, nm_stats)
+
+
+def get_eval_rows(nm, run):
+    """Return a function which gets rows from the eval.json of an experiment."""
+    def _get_eval_rows(eval_json):
+        avg_eval = next(filter(
+            lambda e: e['class_name'] == 'average', eval_json['overall']))
+        return get_conf_mat_rows(EVAL, nm, run, all_scenes, avg_eval['conf_mat'])
+    return _get_eval_rows
+
+
+def get_stream_eval_rows(stream_eval):
+    """Get rows from the stream-eval.json output of evaluate."""
+    for exp_id, exp_result in stream_eval.items():
+        nm_str, run = exp_id.rsplit('-', 1)
+        nm = NoiseMode.from_str(nm_str)
+        for scene, scene_result in exp_result['scenes'].items():
+            yield from get_metric_rows(
+                STREAM_EVAL, nm, int(run), scene, scene_result)
+
+
+def ingest_sweep(conn, root_uri, noise_modes, runs):
+    """Ingest all the outputs of a sweep which exist."""
+    ingest(conn, stats_uri, get_stats_rows)
+    ingest(conn, stream_eval_uri, get_stream_eval_rows)
+    for nm in noise_modes:
+        for run in runs:
+            eval_uri = get_eval_uri(root_uri, get_exp_id(nm, run))
+            ingest(conn, eval_uri, get_eval_rows(nm, run))
+
+
+def query(conn, origin, noise_type, levels, metric, runs=None):
+    """Return counts for each level, summed over scenes and averaged over runs.
+
+    Returns:
+        array with shape (len(levels), num_classes, num_classes) for
+        CONF_MAT, and (len(levels), 4) for the other metrics, which is NaN for
+        levels without results
+    """
+    def get_placeholders(values):
+        return ', '.join(['?'] * len(values))
+
+    levels = [float(level) for level in levels]
+    sql = ('SELECT level, run, class_id, counts FROM latest_results '
+           'WHERE origin = ? AND noise_type = ? AND metric = ? '
+           'AND level IN ({})'.format(get_placeholders(levels)))
+    params = [origin, noise_type, metric] + levels
+    if runs is not None:
+        sql += ' AND run IN ({})'.format(get_placeholders(runs))
+        params += [int(run) for run in runs]
+    rows = conn.execute(sql, params).fetchall()
+
+    counts_len = num_classes if metric == CONF_MAT else 4
+    level_inds = {level: ind for ind, level in enumerate(levels)}
+    sums = np.zeros((len(levels), num_classes, counts_len))
+    num_runs = np.zeros(len(levels))
+    if len(rows) > 0:
+        row_levels, row_runs, class_ids, counts = zip(*rows)
+        row_level_inds = np.array([level_inds[level] for level in row_levels])
+        counts = np.frombuffer(b''.join(counts)).reshape((-1, counts_len))
+        np.add.at(sums, (row_level_inds, np.array(class_ids)), counts)
+
+        # Count distinct runs per level.
+        level_runs = np.unique(
+            np.stack([row_level_inds, np.array(row_runs)], axis=1), axis=0)
+        num_runs = np.bincount(level_runs[:, 0], minlength=len(levels))
+
+    with np.errstate(invalid='ignore'):
+        means = sums / num_runs[:, np.newaxis, np.newaxis]
+    if metric == CONF_MAT:
+        return means
+    return means[:, building_class_id, :]
+
+
+def main():
+    use_remote_data = True
+    root_uri = get_root_uri(use_remote_data)
+    shifts = [0, 10, 20, 30, 40, 50]
+    probs = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
+    runs = [0]
+    noise_modes = ([NoiseMode(NoiseMode.SHIFT, shift) for shift in shifts] +
+                   [NoiseMode(NoiseMode.DROP, prob) for prob in probs])
+
+    conn = open_store()
+    ingest_sweep(conn, root_uri, noise_modes, runs)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
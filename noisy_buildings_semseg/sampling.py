@@ -0,0 +1,119 @@
+import warnings
+
+import numpy as np
+
+# Error types as (true class id, predicted class id), named as in the plots.
+error_types = {
+    '1->2': (1, 2),
+    '2->1': (2, 1)
+}
+
+
+def get_error_rates(conf_mats):
+    """Return p(1->2) and p(2->1) for an array of confusion matrices.
+
+    Returns:
+        array with shape conf_mats.shape[:-2] + (len(error_types),), which is
+        NaN where a class has no pixels
+    """
+    conf_mats = np.asarray(conf_mats, dtype=float)
+    rates = []
+    for true_id, pred_id in error_types.values():
+        totals = conf_mats[..., true_id, :].sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates.append(conf_mats[..., true_id, pred_id] / totals)
+    return np.stack(rates, axis=-1)
+
+
+def get_bootstrap_intervals(scene_conf_mats, rng, num_resamples=1000,
+                            confidence=0.95):
+    """Return bootstrap confidence intervals for the error rates.
+
+    Scenes are resampled with replacement, and the error rates are computed
+    from the summed confusion matrices of each resample, so scenes are
+    weighted by their number of pixels.
+
+    Args:
+        scene_conf_mats: (num_scenes, 3, 3) array
+        rng: np.random.RandomState
+
+    Returns:
+        (len(error_types), 2) array with the lower and upper bound of the
+        interval for each error type
+    """
+    scene_conf_mats = np.asarray(scene_conf_mats, dtype=float)
+    num_scenes = scene_conf_mats.shape[0]
+    # Drawing the number of times each scene is picked avoids materializing
+    # every resample.
+    weights = rng.multinomial(
+        num_scenes, np.full(num_scenes, 1.0 / num_scenes), size=num_resamples)
+    resample_conf_mats = (
+        weights @ scene_conf_mats.reshape((num_scenes, -1))).reshape(
+            (num_resamples,) + scene_conf_mats.shape[1:])
+    rates = get_error_rates(resample_conf_mats)
+
+    alpha = (1.0 - confidence) / 2
+    with warnings.catch_warnings():
+        # Error types without any pixels of the true class have NaN intervals.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(
+            rates, [100 * alpha, 100 * (1 - alpha)], axis=0).T
+
+
+def sample_until_precise(scene_ids, compute_scene_metrics, rng,
+                         precision=0.01, batch_sz=10, min_scenes=20,
+                         max_scenes=300):
+    """Compute metrics for scenes until the error rates are precise.
+
+    Scenes are processed in batches in the order of scene_ids, which should
+    be shuffled. After each batch, bootstrap confidence intervals are
+    computed for the error rates, and sampling stops once the half width of
+    every interval is at most precision, or max_scenes have been processed.
+    Intervals that are NaN, because no sampled scene has pixels of the true
+    class, are undefined and are ignored, unless every interval is
+    undefined, in which case the error rates are never precise.
+
+    Args:
+        scene_ids: list of scene ids
+        compute_scene_metrics: function from scene id to a dict of metrics
+            which includes a (3, 3) confusion matrix under conf_mat
+        rng: np.random.RandomState used for bootstrapping
+        precision: maximum half width of the intervals
+        batch_sz: number of scenes to process between checks
+        min_scenes: minimum number of scenes to process
+        max_scenes: maximum number of scenes to process
+
+    Returns:
+        (list of processed scene ids, list of their metrics, intervals from
+         get_bootstrap_intervals, whether the intervals are within precision)
+    """
+    sampled_ids = []
+    scene_metrics = []
+    scene_conf_mats = []
+    intervals = None
+    is_precise = False
+    defined = np.ones(len(error_types), dtype=bool)
+    scene_ids = scene_ids[0:max_scenes]
+    for batch_start in range(0, len(scene_ids), batch_sz):
+        for scene_id in scene_ids[batch_start:batch_start + batch_sz]:
+            sampled_ids.append(scene_id)
+            scene_metrics.append(compute_scene_metrics(scene_id))
+            scene_conf_mats.append(scene_metrics[-1]['conf_mat'])
+
+        intervals = get_bootstrap_intervals(scene_conf_mats, rng)
+        half_widths = (intervals[:, 1] - intervals[:, 0]) / 2
+        print('Sampled {} scenes, interval half widths: {}'.format(
+            len(sampled_ids), np.round(half_widths, 4).tolist()))
+        defined = ~np.isnan(half_widths)
+        is_precise = bool(
+            defined.any() and np.all(half_widths[defined] <= precision))
+        if len(sampled_ids) >= min_scenes and is_precise:
+            break
+
+    if not defined.all():
+        print('Warning: error rates {} are undefined'.format(
+            [e for e, d in zip(error_types, defined) if not d]))
+    if not is_precise:
+        print('Warning: intervals are not within {} after {} scenes'.format(
+            precision, len(sampled_ids)))
+    return sampled_ids, scene_metrics, intervals, is_precise
@@ -0,0 +1,10 @@
+import pytest
+
+from noisy_buildings_semseg.bench_imports import import_budgets, bench_import
+
+
+# Import times are too noisy to check here, so run bench_imports for those.
+@pytest.mark.parametrize('module', list(import_budgets))
+def test_no_heavy_imports(module):
+    _, imported_heavy_modules = bench_import(module, num_trials=1)
+    assert imported_heavy_modules == []
@@ -0,0 +1,68 @@
+import numpy as np
+
+from noisy_buildings_semseg.metrics import (
+    get_conf_mat, get_tolerant_counts, get_instance_counts,
+    StreamingInstanceCounts)
+
+
+def make_label_arr(rng, shape=(97, 83)):
+    from scipy import ndimage
+
+    buildings = ndimage.binary_dilation(
+        rng.uniform(size=shape) < 0.02, iterations=rng.randint(1, 5))
+    return np.where(buildings, 1, 2).astype(np.uint8)
+
+
+def test_conf_mat_ignores_unknown_class_ids():
+    gt_arr = np.array([1, 2, 0, 1, 2])
+    pred_arr = np.array([1, 255, 2, 3, 2])
+    np.testing.assert_equal(
+        get_conf_mat(gt_arr, pred_arr), [[0, 0, 1], [0, 1, 0], [0, 0, 1]])
+
+
+def test_tolerant_counts_by_window():
+    rng = np.random.RandomState(0)
+    gt_arr, pred_arr = make_label_arr(rng), make_label_arr(rng)
+    tolerance = 3
+    counts = np.zeros(4, dtype=np.int64)
+    for row_off in range(0, gt_arr.shape[0], 20):
+        halo_off = max(row_off - tolerance, 0)
+        halo = slice(halo_off, row_off + 20 + tolerance)
+        inner = (slice(row_off - halo_off, row_off - halo_off + 20),
+                 slice(None))
+        counts += get_tolerant_counts(
+            gt_arr[halo], pred_arr[halo], tolerance, inner=inner)
+    np.testing.assert_equal(
+        counts, get_tolerant_counts(gt_arr, pred_arr, tolerance))
+
+
+def test_instance_counts():
+    gt_arr = np.full((10, 10), 2)
+    pred_arr = np.full((10, 10), 2)
+    gt_arr[0:4, 0:4] = 1
+    pred_arr[0:4, 1:4] = 1
+    gt_arr[6:9, 6:9] = 1
+    pred_arr[0:2, 7:9] = 1
+    # The first pair has IoU 0.75, and the others don't overlap.
+    np.testing.assert_allclose(
+        get_instance_counts(gt_arr, pred_arr), [1, 1, 1, 0.75])
+
+
+def test_streaming_instance_counts_match_whole_scene():
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        gt_arr, pred_arr = make_label_arr(rng), make_label_arr(rng)
+        counts = StreamingInstanceCounts()
+        cuts = np.sort(rng.choice(
+            np.arange(1, gt_arr.shape[0]), rng.randint(0, 8), replace=False))
+        for rows in np.split(np.arange(gt_arr.shape[0]), cuts):
+            counts.add_strip(gt_arr[rows], pred_arr[rows])
+        np.testing.assert_allclose(
+            counts.get_counts(), get_instance_counts(gt_arr, pred_arr))
+
+
+def test_streaming_instance_counts_without_buildings():
+    counts = StreamingInstanceCounts()
+    counts.add_strip(np.full((5, 5), 2), np.full((5, 5), 2))
+    counts.add_strip(np.full((1, 5), 2), np.full((1, 5), 2))
+    np.testing.assert_allclose(counts.get_counts(), [0, 0, 0, 0])
@@ -0,0 +1,212 @@
+import numpy as np
+
+from noisy_buildings_semseg.data import NoiseMode
+from noisy_buildings_semseg.noise import SceneGeometries, make_noisy_geoms
+
+
+def identity(coords):
+    return coords
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def polygon_feature(rings, id=0):
+    return {
+        'geometry': {'type': 'Polygon', 'coordinates': rings},
+        'properties': {'id': id}
+    }
+
+
+def multi_polygon_feature(polygons, id=0):
+    return {
+        'geometry': {'type': 'MultiPolygon', 'coordinates': polygons},
+        'properties': {'id': id}
+    }
+
+
+def make_geoms(polygons):
+    features = [polygon_feature(rings, id) for id, rings in enumerate(polygons)]
+    return SceneGeometries.from_features(features, identity, (650, 650))
+
+
+def make_noisy_features(features, noise_type, level, seed=0):
+    geoms = SceneGeometries.from_features(features, identity, (650, 650))
+    noisy_geoms = make_noisy_geoms(
+        geoms, NoiseMode(noise_type, level), np.random.RandomState(seed))
+    return noisy_geoms.to_features(identity)
+
+
+def buffer(polygons, level):
+    geoms = make_noisy_geoms(
+        make_geoms(polygons), NoiseMode(NoiseMode.BUFFER, level), None)
+    return [f['geometry']['coordinates'] for f in geoms.to_features(identity)]
+
+
+def get_offset(coords, orig_coords):
+    offsets = np.asarray(coords) - np.asarray(orig_coords)
+    np.testing.assert_allclose(offsets, offsets[0:1].repeat(len(offsets), 0))
+    return offsets[0]
+
+
+def test_round_trip_features():
+    features = [
+        polygon_feature([square(0, 0, 10), square(2, 2, 2)], 0),
+        multi_polygon_feature(
+            [[square(20, 20, 5)], [square(40, 40, 8), square(42, 42, 1)]], 1)
+    ]
+    out_features = SceneGeometries.from_features(
+        features, identity, (650, 650)).to_features(identity)
+    for feature, out_feature in zip(features, out_features):
+        assert out_feature['geometry']['type'] == feature['geometry']['type']
+        assert out_feature['properties'] == feature['properties']
+        np.testing.assert_equal(
+            out_feature['geometry']['coordinates'],
+            feature['geometry']['coordinates'])
+
+
+def test_take_features():
+    geoms = SceneGeometries.from_features([
+        polygon_feature([square(0, 0, 10), square(2, 2, 2)], 0),
+        multi_polygon_feature([[square(20, 20, 5)], [square(40, 40, 8)]], 1),
+        polygon_feature([square(60, 60, 3)], 2)
+    ], identity, (650, 650))
+    features = geoms.take_features([2, 1, 1]).to_features(identity)
+    assert [f['properties']['id'] for f in features] == [2, 1, 1]
+    np.testing.assert_equal(
+        features[0]['geometry']['coordinates'], [square(60, 60, 3)])
+    np.testing.assert_equal(
+        features[2]['geometry']['coordinates'],
+        [[square(20, 20, 5)], [square(40, 40, 8)]])
+
+
+def test_filter_rings():
+    geoms = SceneGeometries.from_features([
+        polygon_feature([square(0, 0, 10), square(2, 2, 2)], 0),
+        multi_polygon_feature(
+            [[square(20, 20, 5)], [square(40, 40, 8), square(42, 42, 1)]], 1),
+        polygon_feature([square(60, 60, 3)], 2)
+    ], identity, (650, 650))
+    # Remove the hole of feature 0, the first polygon of feature 1, and the
+    # exterior of feature 2.
+    ring_mask = np.array([True, False, False, True, True, False])
+    features = geoms.filter_rings(ring_mask).to_features(identity)
+    assert [f['properties']['id'] for f in features] == [0, 1]
+    np.testing.assert_equal(
+        features[0]['geometry']['coordinates'], [square(0, 0, 10)])
+    np.testing.assert_equal(
+        features[1]['geometry']['coordinates'],
+        [[square(40, 40, 8), square(42, 42, 1)]])
+
+
+def test_drop():
+    features = [polygon_feature([square(10 * i, 0, 5)], i) for i in range(100)]
+    assert len(make_noisy_features(features, NoiseMode.DROP, 0.0)) == 100
+    assert len(make_noisy_features(features, NoiseMode.DROP, 1.0)) == 0
+    noisy_features = make_noisy_features(features, NoiseMode.DROP, 0.5)
+    assert 30 < len(noisy_features) < 70
+    # Kept features are unchanged.
+    for f in noisy_features:
+        id = f['properties']['id']
+        np.testing.assert_equal(
+            f['geometry']['coordinates'], [square(10 * id, 0, 5)])
+
+
+def test_shift_keeps_holes_and_moves_parts_together():
+    features = [
+        polygon_feature([square(100, 100, 20), square(105, 105, 5)], 0),
+        multi_polygon_feature(
+            [[square(200, 200, 10)], [square(300, 300, 20), square(305, 305, 5)]],
+            1)
+    ]
+    noisy_features = make_noisy_features(features, NoiseMode.SHIFT, 10)
+    assert len(noisy_features) == 2
+    assert noisy_features[1]['geometry']['type'] == 'MultiPolygon'
+
+    for feature, noisy_feature in zip(features, noisy_features):
+        coords = feature['geometry']['coordinates']
+        noisy_coords = noisy_feature['geometry']['coordinates']
+        if feature['geometry']['type'] == 'Polygon':
+            coords, noisy_coords = [coords], [noisy_coords]
+        assert [len(p) for p in noisy_coords] == [len(p) for p in coords]
+        offsets = [
+            get_offset(noisy_ring, ring)
+            for poly, noisy_poly in zip(coords, noisy_coords)
+            for ring, noisy_ring in zip(poly, noisy_poly)]
+        np.testing.assert_allclose(offsets, offsets[0:1] * len(offsets))
+        assert np.all(np.abs(offsets[0]) <= 10)
+
+
+def test_jitter():
+    features = [polygon_feature([square(100, 100, 20)])]
+    noisy_features = make_noisy_features(features, NoiseMode.JITTER, 1.0)
+    ring = np.array(noisy_features[0]['geometry']['coordinates'][0])
+    np.testing.assert_allclose(ring[0], ring[-1])
+    assert len(ring) == 5
+    assert np.all(np.abs(ring - square(100, 100, 20)) < 10)
+    assert np.any(ring != square(100, 100, 20))
+
+
+def test_simplify():
+    # A square with an extra vertex near the middle of each edge.
+    ring = [[0, 0], [5, 0.2], [10, 0], [10.2, 5], [10, 10], [5, 9.8], [0, 10],
+            [0.2, 5], [0, 0]]
+    features = [polygon_feature([ring])]
+    noisy_features = make_noisy_features(features, NoiseMode.SIMPLIFY, 0.5)
+    np.testing.assert_allclose(
+        noisy_features[0]['geometry']['coordinates'][0],
+        [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+
+    # Rings keep at least 3 vertices.
+    noisy_features = make_noisy_features(features, NoiseMode.SIMPLIFY, 100)
+    noisy_ring = noisy_features[0]['geometry']['coordinates'][0]
+    assert len(noisy_ring) == 4
+    np.testing.assert_allclose(noisy_ring[0], noisy_ring[-1])
+
+
+def test_false_pos():
+    features = [polygon_feature([square(10, 10, 30)], i) for i in range(10)]
+    noisy_features = make_noisy_features(features, NoiseMode.FALSE_POS, 2.0)
+    assert len(noisy_features) > len(features)
+    for f in noisy_features[len(features):]:
+        ring = np.array(f['geometry']['coordinates'][0])
+        assert np.all(ring >= 0) and np.all(ring <= 650)
+        np.testing.assert_allclose(ring.max(0) - ring.min(0), [30, 30])
+
+
+def test_buffer_erodes_square():
+    polygons = buffer([[square(50, 50, 10)]], -3)
+    assert len(polygons) == 1
+    np.testing.assert_allclose(polygons[0][0], square(53, 53, 4))
+
+
+def test_buffer_removes_over_eroded_square():
+    for level in [-5, -6, -10, -20]:
+        assert buffer([[square(50, 50, 10)]], level) == []
+
+
+def test_buffer_removes_small_hole_under_dilation():
+    polygons = buffer([[square(100, 100, 20), square(109, 109, 2)]], 2)
+    assert len(polygons) == 1
+    assert len(polygons[0]) == 1
+    np.testing.assert_allclose(polygons[0][0], square(98, 98, 24))
+
+
+def test_buffer_removes_polygon_swallowed_by_hole():
+    assert buffer([[square(100, 100, 20), square(109, 109, 2)]], -6) == []
+
+
+def test_buffer_acute_corners():
+    from shapely.geometry import Polygon
+
+    triangle = [[0, 0], [40, 0], [20, 3], [0, 0]]
+    for level in [-1, 2]:
+        polygons = buffer([[triangle]], level)
+        expected = Polygon(triangle).buffer(level, join_style=2)
+        assert len(polygons) == 1
+        np.testing.assert_allclose(
+            Polygon(polygons[0][0]).area, expected.area, rtol=1e-6)
+        if level < 0:
+            assert Polygon(triangle).contains(Polygon(polygons[0][0]))
+    assert buffer([[triangle]], -4) == []
@@ -0,0 +1,89 @@
+import numpy as np
+
+from noisy_buildings_semseg.sampling import (
+    get_error_rates, get_bootstrap_intervals, sample_until_precise)
+
+
+def make_conf_mat(rng, building_pixels=1000, background_pixels=5000,
+                  fn_rate=0.1, fp_rate=0.02):
+    conf_mat = np.zeros((3, 3))
+    fns = rng.binomial(building_pixels, fn_rate)
+    fps = rng.binomial(background_pixels, fp_rate)
+    conf_mat[1] = [0, building_pixels - fns, fns]
+    conf_mat[2] = [0, fps, background_pixels - fps]
+    return conf_mat
+
+
+def make_scenes(conf_mats):
+    calls = []
+
+    def compute_scene_metrics(scene_id):
+        calls.append(scene_id)
+        return {'conf_mat': conf_mats[scene_id]}
+    return calls, compute_scene_metrics
+
+
+def test_error_rates():
+    conf_mat = np.array([[0, 0, 0], [0, 90, 10], [0, 20, 180]])
+    np.testing.assert_allclose(get_error_rates(conf_mat), [0.1, 0.1])
+
+
+def test_bootstrap_intervals_contain_error_rates():
+    rng = np.random.RandomState(0)
+    conf_mats = [make_conf_mat(rng) for _ in range(50)]
+    intervals = get_bootstrap_intervals(conf_mats, rng)
+    rates = get_error_rates(np.sum(conf_mats, axis=0))
+    assert np.all(intervals[:, 0] <= rates) and np.all(rates <= intervals[:, 1])
+    assert np.all(intervals[:, 1] - intervals[:, 0] < 0.01)
+
+
+def test_bootstrap_intervals_without_building_pixels():
+    rng = np.random.RandomState(0)
+    conf_mats = [make_conf_mat(rng, building_pixels=0) for _ in range(10)]
+    intervals = get_bootstrap_intervals(conf_mats, rng)
+    assert np.all(np.isnan(intervals[0]))
+    assert not np.any(np.isnan(intervals[1]))
+
+
+def test_stops_early_with_low_variance():
+    rng = np.random.RandomState(0)
+    conf_mats = [make_conf_mat(rng) for _ in range(200)]
+    calls, compute_scene_metrics = make_scenes(conf_mats)
+    sampled_ids, _, _, is_precise = sample_until_precise(
+        list(range(200)), compute_scene_metrics, rng, min_scenes=20)
+    assert is_precise
+    assert len(sampled_ids) == 20
+    assert calls == sampled_ids
+
+
+def test_respects_max_scenes():
+    rng = np.random.RandomState(0)
+    # Scenes with very different error rates, so the intervals stay wide.
+    conf_mats = [make_conf_mat(rng, fn_rate=rng.uniform()) for _ in range(200)]
+    calls, compute_scene_metrics = make_scenes(conf_mats)
+    sampled_ids, _, _, is_precise = sample_until_precise(
+        list(range(200)), compute_scene_metrics, rng, max_scenes=50)
+    assert not is_precise
+    assert len(sampled_ids) == 50
+    assert len(calls) == 50
+
+
+def test_ignores_class_without_pixels():
+    rng = np.random.RandomState(0)
+    conf_mats = [make_conf_mat(rng, building_pixels=0) for _ in range(200)]
+    _, compute_scene_metrics = make_scenes(conf_mats)
+    sampled_ids, _, intervals, is_precise = sample_until_precise(
+        list(range(200)), compute_scene_metrics, rng)
+    assert is_precise
+    assert len(sampled_ids) == 20
+    assert np.all(np.isnan(intervals[0]))
+
+
+def test_not_precise_without_any_pixels():
+    rng = np.random.RandomState(0)
+    conf_mats = [np.zeros((3, 3)) for _ in range(100)]
+    _, compute_scene_metrics = make_scenes(conf_mats)
+    sampled_ids, _, _, is_precise = sample_until_precise(
+        list(range(100)), compute_scene_metrics, rng, max_scenes=40)
+    assert not is_precise
+    assert len(sampled_ids) == 40